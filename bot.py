@@ -7,6 +7,9 @@ from datetime import datetime
 from pathlib import Path
 import os
 
+from lib.db import database, write_behind
+from lib.edits import channel_renames, message_edits
+from lib.vote import RENDER_SERVICE
 from utils import get_config
 
 intents = discord.Intents.all()
@@ -138,6 +141,21 @@ async def setup_hook():
     print("ID: " + str(bot.user.id))
 bot.setup_hook = setup_hook
 
+async def close():
+    # Finish scheduled message edits and write held back changes while the
+    # event loop is still running. Renames can take minutes to be allowed,
+    # and are recomputed after a restart anyway. Renders are only stopped
+    # once the edits that may wait on them are done.
+    await channel_renames.close(wait=False)
+    await message_edits.close()
+    RENDER_SERVICE.shutdown()
+    await write_behind.close()
+    await commands.Bot.close(bot)
+bot.close = close
+
 # Run the bot
 token = get_config()['bot']['Token']
-bot.run(token)
\ No newline at end of file
+bot.run(token)
+
+# Write whatever is still queued before exiting
+database.close()
\ No newline at end of file
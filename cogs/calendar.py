@@ -6,18 +6,10 @@ from datetime import datetime, timezone
 import traceback
 
 from lib.channels import get_all_channels, MatchChannel
-from cogs.config import db, has_perms, set_config_value
+from cogs.config import has_perms, set_config_value, get_config_value
+from lib.db import database
+from lib.messages import delete_message, edit_message
 from utils import get_config
-cur = db.cursor()
-cur.execute('''CREATE TABLE IF NOT EXISTS "calendar" (
-	"channel_id"	INTEGER,
-	"message_id"	INTEGER,
-	"category_id"	INTEGER,
-	"guild_id"	INTEGER,
-	PRIMARY KEY("category_id", "message_id"),
-    FOREIGN KEY("guild_id") REFERENCES config("guild_id")
-)''')
-db.commit()
 
 SOVIET_MAPS = ["kursk", "stalingrad", "kharkov"]
 BRITISH_MAPS = ["el alamein", "driel"]
@@ -43,16 +35,10 @@ class CalendarCategory:
     def __iter__(self):
         yield from zip(self.channels, self.matches)
 
-    async def fetch_message(self, guild: discord.Guild = None, channel: discord.TextChannel = None) -> discord.Message:
-        if not channel and not guild:
-            raise ValueError('Must provide either channel or guild')
-
-        if guild and not channel:
-            channel = guild.get_channel(self.channel_id)
-            if not channel:
-                raise ValueError('Could not find channel with ID %s' % self.channel_id)
-        
-        return await channel.fetch_message(self.message_id)
+    async def delete_message(self, guild: discord.Guild):
+        channel = guild.get_channel(self.channel_id)
+        if channel:
+            await delete_message(channel, self.message_id)
     
     def to_embed(self, guild: discord.Guild):
         channel = guild.get_channel(self.category_id)
@@ -93,15 +79,14 @@ class CalendarCategory:
             embed.add_field(name=match.title, value="\n".join(lines))
         return embed
     
-    def save(self):
-        cur.execute('''UPDATE
+    async def save(self):
+        await database.execute('''UPDATE calendar SET
             message_id = ?,
             channel_id = ?
         WHERE category_id = ?''', (self.message_id, self.channel_id, self.category_id))
-        db.commit()
 
-def get_categories(guild: discord.Guild):
-    cur.execute('''SELECT channel_id, message_id, category_id FROM calendar
+async def get_categories(guild: discord.Guild):
+    rows = await database.fetchall('''SELECT channel_id, message_id, category_id FROM calendar
                    WHERE guild_id = ?''', (guild.id,))
 
     cats = {obj[2]: CalendarCategory(
@@ -109,9 +94,9 @@ def get_categories(guild: discord.Guild):
         message_id=obj[1],
         category_id=obj[2],
         guild_id=guild.id
-    ) for obj in cur.fetchall()}
+    ) for obj in rows}
 
-    matches = {m.channel_id: m for m in get_all_channels(guild.id)}
+    matches = {m.channel_id: m for m in await get_all_channels(guild.id)}
     for channel in guild.text_channels:
         cat = cats.get(channel.category_id)
         match = matches.get(channel.id)
@@ -121,14 +106,14 @@ def get_categories(guild: discord.Guild):
     
     return cats
 
-def get_category(category: discord.CategoryChannel):
+async def get_category(category: discord.CategoryChannel):
     calcat = CalendarCategory(
         channel_id=None,
         message_id=None,
         category_id=category.id,
         guild_id=category.guild.id
     )
-    matches = {m.channel_id: m for m in get_all_channels(category.guild.id)}
+    matches = {m.channel_id: m for m in await get_all_channels(category.guild.id)}
     for channel in category.text_channels:
         if channel.id in matches:
             calcat.channels[channel.id] = channel
@@ -154,7 +139,7 @@ class Calendar(commands.Cog):
     @CalendarGroup.command(name="list", description="Show a list of all categories listed on the calendar")
     async def list_calendar(self, interaction: Interaction):
         embed = discord.Embed()
-        cats = get_categories(interaction.guild)
+        cats = await get_categories(interaction.guild)
         
         if cats:
             embed.title = f"There are {str(len(cats))} listed categories."
@@ -179,8 +164,7 @@ class Calendar(commands.Cog):
         channel="The channel to send the calendar to. Leave empty to see the current channel."
     )
     async def set_calendar(self, interaction: Interaction, channel: discord.TextChannel = None):
-        cur.execute('SELECT overview_channel_id FROM config WHERE guild_id = ?', (interaction.guild.id,))
-        (overview_channel_id,) = cur.fetchone()
+        overview_channel_id = await get_config_value(interaction.guild.id, 'overview_channel_id')
 
         if not channel:
             channel = interaction.guild.get_channel(overview_channel_id)
@@ -193,16 +177,15 @@ class Calendar(commands.Cog):
         else:
             await interaction.response.defer(ephemeral=True, thinking=True)
             try:
-                cats = get_categories(interaction.guild)
+                cats = await get_categories(interaction.guild)
                 for cat in cats.values():
                     try:
-                        message = await cat.fetch_message(interaction.guild)
-                        await message.delete()
+                        await cat.delete_message(interaction.guild)
                         await channel.send(embed=cat.to_embed(interaction.guild))
                     except:
                         pass
             finally:
-                set_config_value(interaction.guild.id, 'overview_channel_id', channel.id)
+                await set_config_value(interaction.guild.id, 'overview_channel_id', channel.id)
                 await interaction.followup.send(embed=discord.Embed(description='Set Calendar Channel to '+channel.mention), ephemeral=True)
     
     @CalendarGroup.command(name="add", description="Add a channel category to the calendar")
@@ -218,19 +201,16 @@ class Calendar(commands.Cog):
         if not category or not isinstance(category, discord.CategoryChannel):
             raise commands.BadArgument('ID does not belong to a channel category')
         
-        cur.execute('SELECT * FROM calendar WHERE category_id = ?', (category.id,))
-        if cur.fetchone():
+        if await database.fetchone('SELECT * FROM calendar WHERE category_id = ?', (category.id,)):
             raise commands.BadArgument('Category is already added')
 
-        cur.execute('SELECT overview_channel_id FROM config WHERE guild_id = ?', (interaction.guild.id,))
-        (overview_channel_id,) = cur.fetchone()
+        overview_channel_id = await get_config_value(interaction.guild.id, 'overview_channel_id')
         calendar_channel = interaction.guild.get_channel(overview_channel_id)
 
-        cat = get_category(category)
+        cat = await get_category(category)
         msg = await calendar_channel.send(embed=cat.to_embed(interaction.guild))
 
-        cur.execute('INSERT INTO calendar VALUES (?,?,?,?)', (calendar_channel.id, msg.id, category.id, interaction.guild.id))
-        db.commit()
+        await database.execute('INSERT INTO calendar VALUES (?,?,?,?)', (calendar_channel.id, msg.id, category.id, interaction.guild.id))
 
         embed = discord.Embed(color=discord.Color(7844437))
         embed.set_author(name="Category added", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
@@ -250,19 +230,16 @@ class Calendar(commands.Cog):
         if not category or not isinstance(category, discord.CategoryChannel):
             raise commands.BadArgument('ID does not belong to a channel category')
         
-        cur.execute('SELECT * FROM calendar WHERE category_id = ?', (category.id,))
-        if not cur.fetchone():
+        if not await database.fetchone('SELECT * FROM calendar WHERE category_id = ?', (category.id,)):
             raise commands.BadArgument('Category already isn\'t part of the calendar')
 
-        cat = get_categories(interaction.guild)[category.id]
+        cat = (await get_categories(interaction.guild))[category.id]
         try:
-            msg = await cat.fetch_message(interaction.guild)
-            await msg.delete()
+            await cat.delete_message(interaction.guild)
         except:
             pass
 
-        cur.execute('DELETE FROM calendar WHERE category_id = ?', (cat.category_id,))
-        db.commit()
+        await database.execute('DELETE FROM calendar WHERE category_id = ?', (cat.category_id,))
 
         embed = discord.Embed(color=discord.Color(7844437))
         embed.set_author(name="Category added", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
@@ -273,33 +250,33 @@ class Calendar(commands.Cog):
     async def calendar_updater(self):
         try:
             for guild in self.bot.guilds:
-                cur.execute('SELECT overview_channel_id FROM config WHERE guild_id = ?', (guild.id,))
-                calendar_channel_id = cur.fetchone()
+                calendar_channel_id = await database.fetchone('SELECT overview_channel_id FROM config WHERE guild_id = ?', (guild.id,))
                 if calendar_channel_id is None:
                     continue
                 calendar_channel = guild.get_channel(calendar_channel_id[0])
                 if not calendar_channel:
                     continue
                 
-                for cat in get_categories(guild).values():
+                for cat in (await get_categories(guild)).values():
                     try:
-                        msg = await cat.fetch_message(guild)
-                        if msg.channel != calendar_channel:
-                            await msg.delete()
-                            raise Exception('Boom!') # Trigger "except" clause and resend message
-                        await msg.edit(embed=cat.to_embed(guild))
+                        if cat.channel_id != calendar_channel.id:
+                            # The calendar moved, so move the message along
+                            await cat.delete_message(guild)
+                            resend = True
+                        else:
+                            # Resend right away if the message was deleted
+                            resend = not await edit_message(calendar_channel, cat.message_id, embed=cat.to_embed(guild))
                         self.missed[cat.category_id] = 0
                     except:
-                        missed = self.missed.get(cat.category_id, 0)
-                        missed += 1
-                        if missed > 10:
-                            self.missed[cat.category_id] = 0
-                            msg = await calendar_channel.send(embed=cat.to_embed(guild))
-                            cat.message_id = msg.id
-                            cat.channel_id = msg.channel.id
-                            cat.save()
-                        else:
-                            self.missed[cat.category_id] = missed
+                        missed = self.missed.get(cat.category_id, 0) + 1
+                        resend = missed > 10
+                        self.missed[cat.category_id] = 0 if resend else missed
+
+                    if resend:
+                        msg = await calendar_channel.send(embed=cat.to_embed(guild))
+                        cat.message_id = msg.id
+                        cat.channel_id = msg.channel.id
+                        await cat.save()
         except Exception as e:
             print(f'Explosions! Calendar failed to update...')
             traceback.print_exc()
@@ -312,19 +289,16 @@ class Calendar(commands.Cog):
         if not isinstance(channel, discord.CategoryChannel):
             return
         
-        cur.execute('SELECT * FROM calendar WHERE category_id = ?', (channel.id,))
-        if not cur.fetchone():
+        if not await database.fetchone('SELECT * FROM calendar WHERE category_id = ?', (channel.id,)):
             return
 
-        cat = get_categories(channel.guild)[channel.id]
+        cat = (await get_categories(channel.guild))[channel.id]
         try:
-            msg = await cat.fetch_message(channel.guild)
-            await msg.delete()
+            await cat.delete_message(channel.guild)
         except:
             pass
 
-        cur.execute('DELETE FROM calendar WHERE category_id = ?', (cat.category_id,))
-        db.commit()
+        await database.execute('DELETE FROM calendar WHERE category_id = ?', (cat.category_id,))
             
 
 async def setup(bot):
@@ -1,34 +1,20 @@
 import discord
 from discord.ext import commands
 
-import sqlite3
+from lib.db import database
 
-db = sqlite3.connect('seasonal.db')
-cur = db.cursor()
-cur.execute('''CREATE TABLE IF NOT EXISTS "config" (
-	"guild_id"	INTEGER,
-	"mod_role"	INTEGER,
-	"admin_role"	INTEGER,
-    "overview_channel_id"	INTEGER,
-	"overview_message_id"	INTEGER,
-	PRIMARY KEY("guild_id")
-)''')
-db.commit()
 
-def set_config_value(guild_id, field, value):
-    cur.execute(f'UPDATE config SET {field} = ? WHERE guild_id = ?', (value, guild_id,))
-    db.commit()
+async def set_config_value(guild_id, field, value):
+    await database.execute(f'UPDATE config SET {field} = ? WHERE guild_id = ?', (value, guild_id,))
 
-def get_config_value(guild_id, field):
-    cur.execute(f'SELECT {field} FROM config WHERE guild_id = ?', (guild_id,))
-    return cur.fetchone()[0]
+async def get_config_value(guild_id, field):
+    return (await database.fetchone(f'SELECT {field} FROM config WHERE guild_id = ?', (guild_id,)))[0]
 
 async def has_perms(ctx, mod_role=False, admin_role=False):
     if ctx.channel.permissions_for(ctx.author).administrator or await ctx.bot.is_owner(ctx.author):
         return True
     
-    cur.execute('SELECT mod_role, admin_role FROM config WHERE guild_id = ?', (ctx.guild.id,))
-    mod, admin = cur.fetchone()
+    mod, admin = await database.fetchone('SELECT mod_role, admin_role FROM config WHERE guild_id = ?', (ctx.guild.id,))
     ids = [role.id for role in ctx.author.roles]
     if admin_role:
         return admin in ids
@@ -48,44 +34,39 @@ class config(commands.Cog):
         self.bot = bot
 
     async def cog_load(self):
-        cur.execute('SELECT guild_id FROM config')
-        ids = [guild_id[0] for guild_id in cur.fetchall()]
-        for guild in self.bot.guilds:
-            if guild.id not in ids:
-                cur.execute('INSERT INTO config VALUES (?,0,0,0,0)', (guild.id,))
-        db.commit()
+        ids = [guild_id[0] for guild_id in await database.fetchall('SELECT guild_id FROM config')]
+        await database.execute_batch(
+            ('INSERT INTO config VALUES (?,0,0,0,0)', (guild.id,))
+            for guild in self.bot.guilds if guild.id not in ids
+        )
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        cur.execute('SELECT guild_id FROM config WHERE guild_id = ?', (guild.id,))
-        if not cur.fetchone():
-            cur.execute('INSERT INTO config VALUES (?,0,0,0,0)', (guild.id,))
-            db.commit()
+        if not await database.fetchone('SELECT guild_id FROM config WHERE guild_id = ?', (guild.id,)):
+            await database.execute('INSERT INTO config VALUES (?,0,0,0,0)', (guild.id,))
 
     @commands.command(aliases=['modrole'])
     @check_perms(admin_role=True)
     async def mod_role(self, ctx, role: discord.Role = None):
         if not role:
-            cur.execute('SELECT mod_role FROM config WHERE guild_id = ?', (ctx.guild.id,))
-            role_id = cur.fetchone()[0]
+            role_id = await get_config_value(ctx.guild.id, 'mod_role')
             try: role = (await commands.RoleConverter().convert(ctx, str(role_id))).mention
             except: role = str(role_id)
             await ctx.send(embed=discord.Embed(description='Current Mod Role is '+role))
         else:
-            set_config_value(ctx.guild.id, 'mod_role', role.id)
+            await set_config_value(ctx.guild.id, 'mod_role', role.id)
             await ctx.send(embed=discord.Embed(description='Set Mod Role to '+role.mention))
     
     @commands.command(aliases=['adminrole'])
     @check_perms(admin_role=True)
     async def admin_role(self, ctx, role: discord.Role = None):
         if not role:
-            cur.execute('SELECT admin_role FROM config WHERE guild_id = ?', (ctx.guild.id,))
-            role_id = cur.fetchone()[0]
+            role_id = await get_config_value(ctx.guild.id, 'admin_role')
             try: role = (await commands.RoleConverter().convert(ctx, str(role_id))).mention
             except: role = str(role_id)
             await ctx.send(embed=discord.Embed(description='Current Admin Role is '+role))
         else:
-            set_config_value(ctx.guild.id, 'admin_role', role.id)
+            await set_config_value(ctx.guild.id, 'admin_role', role.id)
             await ctx.send(embed=discord.Embed(description='Set Admin Role to '+role.mention))
     
     # @commands.command()
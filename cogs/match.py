@@ -1,18 +1,21 @@
-from typing import Callable, Optional
+from typing import Callable
 import discord
 from discord import app_commands, ui, Interaction
-from discord.ext import commands, tasks
+from discord.ext import commands
 import asyncio
-import re
 
 import datetime
 from dateutil.parser import parse, parserinfo
 
-from lib.channels import MatchChannel, NotFound, get_all_channels, MIDDLEGROUND_DEFAULT_VOTE_PROGRESS
+from lib.channels import MatchChannel, NotFound, get_all_channels, is_match_channel, MIDDLEGROUND_DEFAULT_VOTE_PROGRESS
 from lib.streams import Stream, FLAGS
-from lib.vote import MapVote, MAPS, Action, Team, Faction, MapState, MiddleGroundVote
+from lib.vote import MapVote, MAPS, Action, Team
+from lib.edits import channel_renames, message_edits
+from lib.messages import delete_message, edit_or_send
+from lib.timers import TimerHeap
+from lib.ban_parser import parse_bans, parse_choice, is_undo, MIDDLEGROUND_OPTIONS, FIRST_BAN_OPTIONS, FIRST_BAN_OPTIONS_MIDDLEGROUND
 from cogs._events import CustomException
-from utils import get_config, retry
+from utils import get_config
 
 
 CHANNEL_EMOJIS = {
@@ -49,15 +52,22 @@ class ConfirmView(ui.View):
         await self.on_cancel(interaction)
 
 
+# IDs of the prediction buttons. They are the same for every match, so that
+# a single view registered at startup handles the buttons of all of them.
+PREDICTIONS_CUSTOM_ID = "predictions:%s"
+
 class PredictionsView(ui.View):
-    def __init__(self, match: MatchChannel):
+    """The buttons to predict the winner of a match with. Which match is
+    looked up from the channel the button was pressed in, so the view can
+    be left without a match to handle the buttons of any message."""
+
+    def __init__(self, match: MatchChannel = None):
         super().__init__(timeout=None)
-        self.match = match
     
-        self.add_item(CallableButton(self.on_press_1, emoji=match.predictions_team1_emoji, style=discord.ButtonStyle.primary))
-        self.add_item(CallableButton(self.on_press_2, emoji=match.predictions_team2_emoji, style=discord.ButtonStyle.primary))
+        self.add_item(CallableButton(self.on_press_1, emoji=match.predictions_team1_emoji if match else None, style=discord.ButtonStyle.primary, custom_id=PREDICTIONS_CUSTOM_ID % 1))
+        self.add_item(CallableButton(self.on_press_2, emoji=match.predictions_team2_emoji if match else None, style=discord.ButtonStyle.primary, custom_id=PREDICTIONS_CUSTOM_ID % 2))
         
-        self.add_item(CallableButton(self.user_make_prediction, emoji="❓", style=discord.ButtonStyle.gray))
+        self.add_item(CallableButton(self.user_make_prediction, emoji="❓", style=discord.ButtonStyle.gray, custom_id=PREDICTIONS_CUSTOM_ID % "status"))
     
     async def on_press_1(self, interaction: Interaction):
         return await self.user_make_prediction(interaction, 1)
@@ -65,19 +75,22 @@ class PredictionsView(ui.View):
         return await self.user_make_prediction(interaction, 2)
     
     async def user_make_prediction(self, interaction: Interaction, vote: int = None):
+        if not is_match_channel(interaction.channel.id):
+            await interaction.response.send_message("Sorry, but this match no longer exists!", ephemeral=True)
+            return
+        match = MatchChannel(interaction.channel.id)
+
         # Has the match started already?
-        if not self.match.should_have_predictions():
+        if not match.should_have_predictions():
             await interaction.response.send_message("Sorry, but predictions are closed! You can no longer vote.", ephemeral=True)
-            payload = await self.match.to_payload(interaction)
-            await interaction.message.edit(view=None, **payload)
+            schedule_match_message(interaction, interaction.channel)
         
         else:
-            id_s = str(interaction.user.id)
-            cur_vote_id = self.match.get_prediction_of_user(interaction.user.id)
+            cur_vote_id = match.get_prediction_of_user(interaction.user.id)
 
             if not vote:
                 if cur_vote_id:
-                    cur_vote = self.match.get_team1(interaction, False) if cur_vote_id == 1 else self.match.get_team2(interaction, False)
+                    cur_vote = match.get_team1(interaction, False) if cur_vote_id == 1 else match.get_team2(interaction, False)
                     embed = discord.Embed(color=discord.Color(7844437))
                     embed.set_author(name=f"Your current vote is {cur_vote}!", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
                     embed.description = "To change your vote you can always press one of the buttons."
@@ -92,36 +105,78 @@ class PredictionsView(ui.View):
                     await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
 
-            elif vote == 1:
-                if id_s in self.match.predictions_team1:
-                    pass
-                elif id_s in self.match.predictions_team2:
-                    self.match.predictions_team1.append(id_s)
-                    self.match.predictions_team2.remove(id_s)
-                else:
-                    self.match.predictions_team1.append(id_s)
-
-            elif vote == 2:
-                if id_s in self.match.predictions_team2:
-                    pass
-                elif id_s in self.match.predictions_team1:
-                    self.match.predictions_team2.append(id_s)
-                    self.match.predictions_team1.remove(id_s)
-                else:
-                    self.match.predictions_team2.append(id_s)
+            else:
+                match.set_prediction(interaction.user.id, vote)
 
-            new_vote = self.match.get_team1(interaction, False) if vote == 1 else self.match.get_team2(interaction, False)
+            new_vote = match.get_team1(interaction, False) if vote == 1 else match.get_team2(interaction, False)
             embed = discord.Embed(color=discord.Color(7844437))
             embed.set_author(name=f"Voted for {new_vote}!", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
-            self.match.save()
-            payload = await self.match.to_payload(interaction)
-            await interaction.message.edit(**payload)
+            match.save_later()
+            schedule_match_message(interaction, interaction.channel)
+
+async def write_match_message(interaction: Interaction, channel: discord.TextChannel, delay_predictions=False, send=False, update_image=False):
+    match = MatchChannel(channel.id)
+    payload = await match.to_payload(interaction, update_image, delay_predictions)
+
+    if match.should_have_predictions() and not delay_predictions:
+        payload['view'] = PredictionsView(match)
+    else:
+        payload['view'] = None
+
+    if 'file' in payload:
+        payload['attachments'] = [payload.pop('file')]
+    msg = await edit_or_send(channel, match.message_id, send=send, **payload)
+    if msg:
+        match.message_id = msg.id
+        await match.save()
+
+def schedule_match_message(interaction: Interaction, channel: discord.TextChannel, send=False, update_image=False, delay_predictions=False):
+    """Update the match message in the background. Updates that come in
+    while one is still waiting for the rate limit are merged into one."""
+    message_edits.schedule(
+        channel.id, channel.id,
+        lambda **flags: write_match_message(interaction, channel, delay_predictions, **flags),
+        send=send, update_image=update_image
+    )
+
+def get_channel_name(channel: discord.TextChannel):
+    """Get the name a match channel should have, prefixed with the emoji
+    of the phase the match is in."""
+    match = MatchChannel(channel.id)
+    
+    channel_name = channel.name
+    for emoji in CHANNEL_EMOJIS.values():
+        if channel_name.startswith(emoji):
+            channel_name = channel_name.replace(emoji, '')
+            break
+    
+    if match.result: emoji = CHANNEL_EMOJIS["RESULT"]
+    elif match.has_vote and not match.vote_result: emoji = CHANNEL_EMOJIS["BAN"]
+    elif match.match_start and datetime.datetime.now(datetime.timezone.utc) > match.match_start: emoji = CHANNEL_EMOJIS["LIVE"]
+    else: emoji = CHANNEL_EMOJIS["PLANNED"]
+
+    return emoji + channel_name
+
+async def rename_channel(channel: discord.TextChannel):
+    if not is_match_channel(channel.id):
+        return False
+    name = get_channel_name(channel)
+    if name == channel.name:
+        return False
+    await channel.edit(name=name)
 
 class match(commands.Cog):
     def __init__(self, bot):
         self.bot: commands.Bot = bot
+        # Messages that were ignored because they weren't sent in a match channel
+        self.skipped_messages = 0
+        # Fire when a match starts, by channel ID
+        self.match_start_timers = TimerHeap(self._on_match_start)
+
+    async def cog_unload(self):
+        self.match_start_timers.stop()
 
     MatchGroup = app_commands.Group(name="match", description="Match configuration", default_permissions=discord.Permissions())
     MatchSetGroup = app_commands.Group(name="set", description="Change one of the match's properties", parent=MatchGroup)
@@ -135,7 +190,7 @@ class match(commands.Cog):
     @MatchGroup.command(name="list", description="Show a list of all match channels")
     async def list(self, interaction: Interaction):
         embed = discord.Embed()
-        matches = get_all_channels(interaction.guild.id)
+        matches = await get_all_channels(interaction.guild.id)
         
         if matches:
             embed.title = f"There are {str(len(matches))} ongoing matches."
@@ -187,7 +242,7 @@ class match(commands.Cog):
         try: MatchChannel(channel.id)
         except NotFound: pass
         else: raise commands.BadArgument('A match is already linked with this channel.')
-        MatchChannel.new(channel=channel, title=title, desc=description, team1=team1.id if team1 else None, team2=team2.id if team1 else None, has_vote=enable_voting, has_predictions=enable_voting)
+        await MatchChannel.new(channel=channel, title=title, desc=description, team1=team1.id if team1 else None, team2=team2.id if team1 else None, has_vote=enable_voting, has_predictions=enable_voting)
         overwrites = channel.overwrites
         defaults = overwrites.setdefault(interaction.guild.default_role, discord.PermissionOverwrite())
         defaults.update(send_messages=False)
@@ -211,14 +266,8 @@ class match(commands.Cog):
         async def on_confirm(_interaction: Interaction):
             embed = discord.Embed(description=channel.mention, color=discord.Color(7844437))
             embed.set_author(name="Match removed", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
-            match.delete()
-
-            try:
-                msg = await channel.fetch_message(match.message_id)
-            except discord.NotFound:
-                pass
-            else:
-                await msg.delete()
+            await match.delete()
+            await delete_message(channel, match.message_id)
             
             await _interaction.response.edit_message(embed=embed, view=None)
         async def on_cancel(_interaction: Interaction):
@@ -230,8 +279,8 @@ class match(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel):
-        if isinstance(channel, discord.TextChannel):
-            try: MatchChannel(channel.id).delete()
+        if isinstance(channel, discord.TextChannel) and is_match_channel(channel.id):
+            try: await MatchChannel(channel.id).delete()
             except: pass
 
 
@@ -248,7 +297,7 @@ class match(commands.Cog):
     async def _set_match_prop(self, interaction: Interaction, channel: discord.TextChannel, prop_name: str, value, display):
         match = MatchChannel(channel.id)
         setattr(match, prop_name, value)
-        match.save()
+        await match.save()
         embed = discord.Embed(color=discord.Color(7844437))
         embed.set_author(name="Property updated", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
         embed.description = f"{channel.mention}'s `{prop_name}` is now {display}."
@@ -280,6 +329,7 @@ class match(commands.Cog):
             match_start = match_start.replace(tzinfo=datetime.timezone.utc)
         match_start = match_start.astimezone(datetime.timezone.utc)
         await self._set_match_prop(interaction, channel, "match_start", match_start, match_start.isoformat(sep=' '))
+        self.match_start_timers.set(channel.id, match_start)
     @MatchSetGroup.command(name="team1")
     @app_commands.describe(
         channel="The match channel",
@@ -344,7 +394,7 @@ class match(commands.Cog):
         embed.set_author(name='Add this stream?')
 
         async def on_confirm(_interaction: Interaction):
-            stream = Stream.new(channel.id, language, name, url)
+            stream = await Stream.new(channel.id, language, name, url)
             embed = discord.Embed(description=stream.to_text(), color=discord.Color(7844437))
             embed.set_author(name="Streamer added", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
             await _interaction.message.edit(embed=embed, view=None)
@@ -379,7 +429,7 @@ class match(commands.Cog):
         async def on_confirm(_interaction: Interaction):
             embed = discord.Embed(description=stream.to_text(), color=discord.Color(7844437))
             embed.set_author(name="Streamer removed", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
-            stream.delete()
+            await stream.delete()
             await _interaction.message.edit(embed=embed, view=None)
             await self._update_match(interaction, channel, send=False)
         async def on_cancel(_interaction: Interaction):
@@ -399,24 +449,7 @@ class match(commands.Cog):
 
     async def _update_match(self, interaction: Interaction, channel: discord.TextChannel, send=True, update_image=False, update_perms=False, delay_predictions=False):
         match = MatchChannel(channel.id)
-        payload = await match.to_payload(interaction, update_image, delay_predictions)
-
-        if match.should_have_predictions() and not delay_predictions:
-            payload['view'] = PredictionsView(match)
-        else:
-            payload['view'] = None
-
-        try:
-            msg = await retry(times=2)(channel.fetch_message)(match.message_id)
-        except discord.NotFound:
-            if send:
-                msg = await channel.send(**payload)
-                match.message_id = msg.id
-                match.save()
-        else:
-            if 'file' in payload:
-                payload['attachments'] = [payload.pop('file')]
-            await msg.edit(**payload)
+        schedule_match_message(interaction, channel, send=send, update_image=update_image, delay_predictions=delay_predictions)
 
         if update_perms:
             overwrites = channel.overwrites
@@ -440,21 +473,9 @@ class match(commands.Cog):
             await self._update_match(interaction, channel, send=False, delay_predictions=False)
                 
     async def _update_channel_name(self, channel: discord.TextChannel):
-        match = MatchChannel(channel.id)
-        
-        channel_name = channel.name
-        for emoji in CHANNEL_EMOJIS.values():
-            if channel_name.startswith(emoji):
-                channel_name = channel_name.replace(emoji, '')
-                break
-        
-        if match.result: emoji = CHANNEL_EMOJIS["RESULT"]
-        elif match.has_vote and not match.vote_result: emoji = CHANNEL_EMOJIS["BAN"]
-        elif match.match_start and datetime.datetime.now(datetime.timezone.utc) > match.match_start: emoji = CHANNEL_EMOJIS["LIVE"]
-        else: emoji = CHANNEL_EMOJIS["PLANNED"]
-
-        if emoji + channel_name != channel.name:
-            await channel.edit(name=emoji+channel_name)
+        # Only the latest name is applied once the rename limit allows it
+        if get_channel_name(channel) != channel.name or channel_renames.is_pending(channel.id):
+            channel_renames.schedule(channel.id, channel.id, lambda: rename_channel(channel))
 
 
     @MatchGroup.command(name="reveal", description="Start showing the match in its channel")
@@ -476,13 +497,7 @@ class match(commands.Cog):
     )
     async def hide(self, interaction: Interaction, channel: discord.TextChannel):
         match = MatchChannel(channel.id)
-
-        try:
-            msg = await channel.fetch_message(match.message_id)
-        except discord.NotFound:
-            pass
-        else:
-            await msg.delete()
+        await delete_message(channel, match.message_id)
 
         embed = discord.Embed(color=discord.Color(7844437))
         embed.set_author(name="Match hidden", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
@@ -491,7 +506,7 @@ class match(commands.Cog):
 
 
     async def _after_setting_change(self, interaction: Interaction, match: MatchChannel, channel: discord.TextChannel, output: str = None):
-        match.save()
+        await match.save()
         embed = discord.Embed(color=discord.Color(7844437))
         embed.set_author(name="Property updated", icon_url="https://cdn.discordapp.com/emojis/809149148356018256.png")
         embed.description = f"{output} for {channel.mention}."
@@ -600,6 +615,9 @@ class match(commands.Cog):
         if message.author.id == self.bot.user.id: return
 
         # Is this a match channel?
+        if not is_match_channel(message.channel.id):
+            self.skipped_messages += 1
+            return
         try: match = MatchChannel(message.channel.id)
         except: return
         
@@ -609,8 +627,7 @@ class match(commands.Cog):
             try:
                 is_admin = True if message.channel.permissions_for(message.author).manage_messages else False
                 is_middleground = match.use_middleground_server()
-                content = message.content.lower()
-                words = content.split()
+                content = message.content
 
                 if is_middleground is None:
                     try: team1_id = int(match.team1)
@@ -628,16 +645,12 @@ class match(commands.Cog):
                         team = None
 
                     if team:
-                        if 'yes' in words or 'middleground' in words:
-                            vote = MiddleGroundVote.Yes
-                        elif 'no' in words:
-                            vote = MiddleGroundVote.No
-                        else:
+                        vote = parse_choice(content, MIDDLEGROUND_OPTIONS)
+                        if vote is None:
                             raise CustomException('Invalid option!', 'Choose between either "yes" or "no".')
                         
                         # Update vote!
-                        match.vote_middleground(team=team, vote=vote)
-                        match.save()
+                        await match.vote_middleground(team=team, vote=vote)
                         
                         # Update message
                         ctx = await self.bot.get_context(message)
@@ -657,73 +670,43 @@ class match(commands.Cog):
 
                         if not match.vote_first_ban:
                             if is_middleground:
-                                if 'extra' in words:
-                                    match.vote_first_ban = team.value
-                                elif 'final' in words:
-                                    match.vote_first_ban = team.other().value
-                                else:
+                                wants_first_ban = parse_choice(content, FIRST_BAN_OPTIONS_MIDDLEGROUND)
+                                if wants_first_ban is None:
                                     raise CustomException('Invalid option!', 'Choose between either "extra" or "final".')
-
                             else:
-                                if 'ban' in words or 'extra' in words:
-                                    match.vote_first_ban = team.value
-                                elif 'host' in words or 'server' in words:
-                                    match.vote_first_ban = team.other().value
-                                else:
+                                wants_first_ban = parse_choice(content, FIRST_BAN_OPTIONS)
+                                if wants_first_ban is None:
                                     raise CustomException('Invalid option!', 'Choose between either "ban" or "host".')
 
+                            match.vote_first_ban = team.value if wants_first_ban else team.other().value
+
                             # Update vote!
                             match.vote.add_progress(team=match.vote_first_ban, action=Action.HasFirstBan, faction=0, map_index=0)
-                            match.save()
+                            await match.save()
                             
                             # Update message
                             ctx = await self.bot.get_context(message)
                             await self._update_match(ctx, message.channel, update_image=False)
                         
                         else:
-                            if is_admin and content in ['back', 'reverse', 'undo']:
+                            if is_admin and is_undo(content):
                                 # Undo last ban
-                                match.undo()
+                                await match.undo()
                             
                             else:
-                                lines = re.split(r" *[,&\n-] *", content)
-                                if len(lines) > turns:
-                                    raise CustomException('Too many maps!', f'You can only ban {turns} more maps this turn!')
-                                
-                                bans = list()
-                                for line in lines:
-
-                                    map, faction = line.rsplit(' ', 1)
-                                    
-                                    if faction in ('allies', 'us', 'rus', 'gb'):
-                                        faction = Faction.Allies
-                                    elif faction in ('axis', 'ger'):
-                                        faction = Faction.Axis
-                                    else:
-                                        raise CustomException('Invalid faction!', 'Available factions are Allies, Axis.')
-
-                                    try:
-                                        map_index = [m.lower() for m in MAPS].index(map)
-                                    except ValueError:
-                                        raise CustomException('Invalid map!', 'Available maps are %s.' % ', '.join(MAPS))
-                                    map = MAPS[map_index]
-                                
-                                    # Is this map available?
-                                    if (
-                                        (team == 1 and match.vote.maps[Team.One][faction][map] != MapState.Available) or
-                                        (team == 2 and match.vote.maps[Team.Two][faction][map] != MapState.Available)
-                                    ):
-                                        raise CustomException(f'{map} {faction.name} was already banned!', 'Please pick another one.')
-                                    
-                                    ban = (faction, map)
-                                    if ban in bans:
-                                        raise CustomException(f'You cannot ban the same map twice!', 'Please pick two unique maps.')
-
-                                    bans.append(ban)
+                                bans, errors = parse_bans(content, turns=turns, vote=match.vote, team=team)
+                                if len(errors) == 1:
+                                    raise CustomException(*errors[0])
+                                elif errors:
+                                    raise CustomException(
+                                        f'There are {len(errors)} problems with your bans!',
+                                        '\n'.join(f'**{error.title}** {error.description}' for error in errors)
+                                    )
 
                                 # Ban it!
-                                for faction, map in bans:
-                                    match.ban_map(team=team, faction=faction, map=map)
+                                for faction, map_index in bans:
+                                    await match.ban_map(team=team, faction=faction, map=MAPS[map_index], save=False)
+                                await match.save()
                             
                             # Update message
                             ctx = await self.bot.get_context(message)
@@ -767,57 +750,58 @@ class match(commands.Cog):
     )
     async def predictions_enable(self, interaction: Interaction, channel: discord.TextChannel):
         match = MatchChannel(channel.id)
-        match.predictions_team1 = []
-        match.predictions_team2 = []
+        match.reset_predictions()
         match.predictions_team1_emoji = get_config()['visuals']['DefaultTeam1Emoji']
         match.predictions_team2_emoji = get_config()['visuals']['DefaultTeam2Emoji']
         await self._after_setting_change(interaction, match, channel, "Reset predictions")
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel):
+        if not is_match_channel(channel.id): return
         try: match = MatchChannel(channel.id)
         except: pass
-        else: match.delete()
+        else: await match.delete()
 
-    @tasks.loop(minutes=3)
-    async def channel_name_updater(self):
-        try:
-            for guild in self.bot.guilds:
-                matches = get_all_channels(guild.id)
-                
-                for match in matches:
-                    channel = guild.get_channel(match.channel_id)
-                    if channel:
-                        await self._update_channel_name(channel)
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: Interaction):
+        # Match messages sent before the prediction buttons had fixed IDs
+        # still have buttons that nothing listens to. Replace them the first
+        # time one is pressed.
+        if interaction.type != discord.InteractionType.component or not is_match_channel(interaction.channel_id):
+            return
+        if interaction.data.get('custom_id', '').startswith(PREDICTIONS_CUSTOM_ID % ''):
+            return
+        match = MatchChannel(interaction.channel_id)
+        if interaction.message.id != match.message_id:
+            return
+        await interaction.response.send_message("Sorry, these buttons were outdated. Please try again!", ephemeral=True)
+        schedule_match_message(interaction, interaction.channel)
+
+    async def _on_match_start(self, channel_id: int):
+        # The match went live, so its predictions close right now
+        channel = self.bot.get_channel(channel_id)
+        if not channel or not is_match_channel(channel_id):
+            return
+        match = MatchChannel(channel_id)
+        await self._update_channel_name(channel)
+        if match.should_show_predictions() and match.message_id:
+            schedule_match_message(channel, channel)
 
-        except Exception as e:
-            print('\n\nEXCEPTION WAAAAAA!!!\n', e.__class__.__name__, str(e))
-                    
     @commands.Cog.listener()
     async def on_ready(self):
         await self.bot.wait_until_ready()
+        # Catch up on whatever changed while offline. After this, channels
+        # are only updated when their match changes or starts.
         for guild in self.bot.guilds:
-            matches = get_all_channels(guild.id)
-            for match in matches:
-                if match.should_show_predictions():
-                    channel = guild.get_channel(match.channel_id)
-                    try:
-                        message = await channel.fetch_message(match.message_id)
-                    except:
-                        continue
-                    else:
-                        if match.should_have_predictions():
-                            ctx = await self.bot.get_context(message)
-                            await self._update_match(ctx, channel, send=False)
-                        else:
-                            if message.components:
-                                await message.edit(view=ui.View())
-                                print('-', channel.name, match.title)
-
-        #self.channel_name_updater.add_exception_type(Exception)
-        await asyncio.sleep(60) # Don't hit rate limits during testing
-        self.channel_name_updater.start()
+            for match in await get_all_channels(guild.id):
+                channel = guild.get_channel(match.channel_id)
+                if channel:
+                    await self._update_channel_name(channel)
+                self.match_start_timers.set(match.channel_id, match.match_start)
+        self.match_start_timers.start()
 
 
 async def setup(bot):
     await bot.add_cog(match(bot))
+    # Handles the prediction buttons of all matches, also after a restart
+    bot.add_view(PredictionsView())
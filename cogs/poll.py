@@ -1,23 +1,14 @@
-from typing import Dict, List
+from typing import Dict, List, Union
 import discord
 from discord import app_commands, Interaction, ui
 from discord.ext import commands
 from datetime import datetime
 import re
 
-from cogs.config import db
+from lib.db import database, write_behind
+from lib.messages import get_message
 from cogs.match import ConfirmView
 from lib.channels import NotFound
-cur = db.cursor()
-cur.execute('''CREATE TABLE IF NOT EXISTS "polls" (
-	"guild_id"	INTEGER,
-	"channel_id"	INTEGER,
-	"message_id"	INTEGER,
-	"votes"	TEXT,
-	"question"	TEXT,
-	PRIMARY KEY("message_id")
-)''')
-db.commit()
 
 
 NUMBER_EMOJIS = [
@@ -34,10 +25,15 @@ NUMBER_EMOJIS = [
     "\ud83d\udd1f"
 ]
 
+# IDs of the poll buttons. They are the same for every poll, so that a
+# single view registered at startup handles the buttons of all of them.
+POLL_CUSTOM_ID = "poll:%s"
+MAX_CHOICES = 10
+
 POLLS: Dict[int, 'Poll'] = dict()
 
 class Poll:
-    def __init__(self, message: discord.Message, data: str, question: str):
+    def __init__(self, message: Union[discord.Message, discord.PartialMessage], data: str, question: str):
         self.message = message
         self.data: Dict[int, List[int]]
         self.question = question
@@ -57,20 +53,21 @@ class Poll:
         self.data = res
 
     @classmethod
-    def from_db(cls, message: discord.Message):
-        cur.execute('''SELECT votes, question FROM polls WHERE message_id = ?''', (message.id,))
-        data = cur.fetchone()
+    async def from_db(cls, message: discord.Message):
+        # Polls that are loaded are kept up to date, and may have votes that aren't written yet
+        if message.id in POLLS:
+            return POLLS[message.id]
+        data = await database.fetchone('''SELECT votes, question FROM polls WHERE message_id = ?''', (message.id,))
         if not data:
             raise NotFound("No poll associated with this message")
         return cls(message, *data)
     
     @classmethod
-    def create(cls, message: discord.Message, num_choices: int, question: str):
+    async def create(cls, message: discord.Message, num_choices: int, question: str):
         data = ""
         for i in range(1, num_choices + 1):
             data += f"{i}:"
-        cur.execute('''INSERT INTO polls VALUES (?,?,?,?,?)''', (message.guild.id, message.channel.id, message.id, data, question))
-        db.commit()
+        await database.execute('''INSERT INTO polls VALUES (?,?,?,?,?)''', (message.guild.id, message.channel.id, message.id, data, question))
         return cls(message, data, question)
     
     @property
@@ -82,17 +79,21 @@ class Poll:
                 output += f"{vote},"
         return output
 
-    def save(self):
-        cur.execute('''UPDATE polls SET
+    def _get_statements(self):
+        return [('''UPDATE polls SET
             votes = ?,
             question = ?
-        WHERE message_id = ?''', (self.packed, self.question, self.message.id))
-        db.commit()
+        WHERE message_id = ?''', (self.packed, self.question, self.message.id))]
+
+    async def save(self):
+        await database.execute_batch(self._get_statements())
+
+    def save_later(self):
+        write_behind.schedule(('polls', self.message.id), self, self._get_statements)
     
-    def delete(self):
-        cur.execute('''DELETE FROM polls
+    async def delete(self):
+        await database.execute('''DELETE FROM polls
         WHERE message_id = ?''', (self.message.id,))
-        db.commit()
         if self.message.id in POLLS:
             del POLLS[self.message.id]
     
@@ -117,13 +118,17 @@ class Poll:
             del self.data[vote][index]
         
         self.data[choice].append(role_id)
-        self.save()
+        self.save_later()
 
 
 class poll(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self):
+        # Handles the buttons of all polls, also after a restart
+        self.bot.add_view(self._get_poll_view(MAX_CHOICES))
+
     PollGroup = app_commands.Group(name="poll", description="Polls", default_permissions=discord.Permissions())
 
     def _get_poll_view(self, num_choices: int):
@@ -153,11 +158,11 @@ class poll(commands.Cog):
             on_press_7, on_press_8, on_press_9, on_press_10]
 
         for i in range(num_choices):
-            button = ui.Button(style=discord.ButtonStyle.primary, emoji=NUMBER_EMOJIS[i+1])
+            button = ui.Button(style=discord.ButtonStyle.primary, emoji=NUMBER_EMOJIS[i+1], custom_id=POLL_CUSTOM_ID % (i+1))
             button.callback = callbacks[i]
             view.add_item(button)
         
-        button = ui.Button(style=discord.ButtonStyle.gray, emoji="❓")
+        button = ui.Button(style=discord.ButtonStyle.gray, emoji="❓", custom_id=POLL_CUSTOM_ID % "status")
         button.callback = self.user_ask_vote_status
         view.add_item(button)
 
@@ -180,7 +185,7 @@ class poll(commands.Cog):
         await interaction.response.send_message(embed=embed, view=view)
         
         message = await interaction.original_response()
-        Poll.create(message, len(choices), question)
+        await Poll.create(message, len(choices), question)
     
     async def user_make_vote(self, interaction: Interaction, number: int):
         role = self.find_role(interaction.user)
@@ -192,7 +197,7 @@ class poll(commands.Cog):
             return
         
         try:
-            poll = Poll.from_db(interaction.message)
+            poll = await Poll.from_db(interaction.message)
         except NotFound:
             embed = discord.Embed(color=discord.Color.from_rgb(221, 46, 68))
             embed.set_author(name="This poll has expired!", icon_url='https://cdn.discordapp.com/emojis/808045512393621585.png')
@@ -238,7 +243,7 @@ class poll(commands.Cog):
             return
         
         try:
-            poll = Poll.from_db(interaction.message)
+            poll = await Poll.from_db(interaction.message)
         except NotFound:
             embed = discord.Embed(color=discord.Color.from_rgb(221, 46, 68))
             embed.set_author(name="This poll has expired!", icon_url='https://cdn.discordapp.com/emojis/808045512393621585.png')
@@ -270,26 +275,34 @@ class poll(commands.Cog):
     
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
-        cur.execute('''SELECT votes FROM polls WHERE message_id = ?''', (payload.message_id,))
-        if cur.fetchone():
-            cur.execute('''DELETE FROM polls WHERE message_id = ?''', (payload.message_id,))
-            db.commit()
+        if await database.fetchone('''SELECT votes FROM polls WHERE message_id = ?''', (payload.message_id,)):
+            await database.execute('''DELETE FROM polls WHERE message_id = ?''', (payload.message_id,))
 
     @commands.Cog.listener()    
     async def on_ready(self):
-        cur.execute('''SELECT * FROM polls''')
-        polls = cur.fetchall()
+        polls = await database.fetchall('''SELECT * FROM polls''')
         for guild_id, channel_id, message_id, data, question in polls:
             guild = self.bot.get_guild(guild_id)
-            channel = guild.get_channel(channel_id)
-            try:
-                message = await channel.fetch_message(message_id)
-            except:
-                print("Couldn't find poll", message_id, "in", channel.name)
-            else:
-                poll = Poll(message, data, question)
-                view = self._get_poll_view(len(poll.data))
-                await message.edit(view=view)
+            channel = guild.get_channel(channel_id) if guild else None
+            if not channel:
+                print("Couldn't find channel of poll", message_id)
+                continue
+            # The message itself is only fetched once the poll ends
+            Poll(get_message(channel, message_id), data, question)
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: Interaction):
+        # Polls sent before the buttons had fixed IDs still have buttons that
+        # nothing listens to. Replace them the first time one is pressed.
+        if interaction.type != discord.InteractionType.component or not interaction.message:
+            return
+        if interaction.data.get('custom_id', '').startswith(POLL_CUSTOM_ID % ''):
+            return
+        poll = POLLS.get(interaction.message.id)
+        if poll is None:
+            return
+        await interaction.response.send_message("Sorry, these buttons were outdated. Please try again!", ephemeral=True)
+        await interaction.message.edit(view=self._get_poll_view(len(poll.data)))
 
     async def poll_name_autocomplete(self, interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
         return [
@@ -344,12 +357,12 @@ class poll(commands.Cog):
         if poll is None or poll.message.guild != interaction.guild:
             raise commands.BadArgument("Unknown poll")
         
-        embed = poll.message.embeds[0]
+        embed = (await poll.message.fetch()).embeds[0]
 
         embed_result = self.get_results_embed(embed, poll, show_teams=reveal_teams)
         embed_result.set_footer(text=f"{poll.total_votes} votes • The poll has ended. You can no longer vote.")
         await poll.message.edit(embed=embed_result, view=ui.View())
-        poll.delete()
+        await poll.delete()
 
         embed_teams = self.get_results_embed(embed, poll, show_teams=True)
         embed_teams.remove_footer()
@@ -365,7 +378,7 @@ class poll(commands.Cog):
         if poll is None or poll.message.guild != interaction.guild:
             raise commands.BadArgument("Unknown poll")
         
-        embed = poll.message.embeds[0]
+        embed = (await poll.message.fetch()).embeds[0]
         embed = self.get_results_embed(embed, poll, show_teams=True)
                 
         embed.description = f"[Jump to message]({poll.message.jump_url})\n\n" + embed.description
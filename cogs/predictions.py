@@ -1,10 +1,90 @@
 import discord
 from discord.ext import commands
-from discord import app_commands, Interaction
+from discord import app_commands, Interaction, ui
 
-from lib.channels import get_predictions
+from cogs.match import CallableButton
+from lib.channels import get_leaderboard, get_prediction_rank, count_predictors
 from utils import get_name
 
+# The amount of users shown on each page of the leaderboard
+PAGE_SIZE = 20
+
+async def get_leaderboard_embed(interaction: Interaction, user: discord.Member, page: int):
+    guild = interaction.guild
+    own = await get_prediction_rank(guild.id, user.id)
+    rows = await get_leaderboard(guild.id, page * PAGE_SIZE, PAGE_SIZE)
+
+    fmt = "`{: <5} {: <25} {: <5} {: <5} {: <4} {: <5}`"
+    embed = discord.Embed(description=fmt.format("RANK", "USERNAME", "RIGHT", "WRONG", "SUM", "RATE"))
+
+    def add_line(rank: int, user_id: int, won: int, lost: int):
+        member = guild.get_member(user_id)
+        name = get_name(member).replace('`', '') if member else "Unknown user"
+        sum = won + lost
+        rate = won / sum
+        pct = "100%" if won == sum else f"{round(rate*100, 1)}%"
+        embed.description += ("\n" + fmt.format("#" + str(rank), name[:25], won, lost, sum, pct))
+
+    for i, (user_id, won, lost) in enumerate(rows):
+        add_line(page * PAGE_SIZE + i + 1, user_id, won, lost)
+
+    if own:
+        rank, won, lost = own
+        if not page * PAGE_SIZE < rank <= page * PAGE_SIZE + len(rows):
+            # Always show where the user is at
+            embed.description += "\n..."
+            add_line(rank, user.id, won, lost)
+
+        name = get_name(user) if user != interaction.user else None
+        author = f"You have guessed right {won} times!" if not name else f"{name} has guessed right {won} times!"
+        if rank == 1:
+            author = "🏆 " + author
+        elif rank == 2:
+            author = "🥈 " + author
+        elif rank == 3:
+            author = "🥉 " + author
+    else:
+        author = "You have not yet made any predictions!" if user == interaction.user else f"{get_name(user)} has not yet made any predictions!"
+
+    embed.set_author(
+        name=author,
+        icon_url=user.avatar.url
+    )
+    return embed
+
+
+class LeaderboardView(ui.View):
+    def __init__(self, user: discord.Member, num_users: int, page: int = 0):
+        super().__init__(timeout=300)
+        self.user = user
+        self.page = page
+        self.num_pages = max(1, (num_users + PAGE_SIZE - 1) // PAGE_SIZE)
+
+        self.previous = CallableButton(self.on_previous, emoji="◀️", style=discord.ButtonStyle.gray)
+        self.indicator = ui.Button(style=discord.ButtonStyle.gray, disabled=True)
+        self.next = CallableButton(self.on_next, emoji="▶️", style=discord.ButtonStyle.gray)
+        self.add_item(self.previous)
+        self.add_item(self.indicator)
+        self.add_item(self.next)
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous.disabled = self.page <= 0
+        self.next.disabled = self.page >= self.num_pages - 1
+        self.indicator.label = f"{self.page + 1}/{self.num_pages}"
+
+    async def on_previous(self, interaction: Interaction):
+        await self.show_page(interaction, self.page - 1)
+    async def on_next(self, interaction: Interaction):
+        await self.show_page(interaction, self.page + 1)
+
+    async def show_page(self, interaction: Interaction, page: int):
+        self.page = max(0, min(page, self.num_pages - 1))
+        self._update_buttons()
+        embed = await get_leaderboard_embed(interaction, self.user, self.page)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+
 class predictions(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -16,55 +96,13 @@ class predictions(commands.Cog):
     async def see_predictions(self, interaction: Interaction, user: discord.Member = None):
         user = user or interaction.user
 
-        predictions = get_predictions(interaction.guild.id)
-        sorted_predictions = sorted(predictions.items(), key=lambda x: x[1][0]*1000 - x[1][1], reverse=True)
-
-        fmt = "`{: <5} {: <25} {: <5} {: <5} {: <4} {: <5}`"
-        embed = discord.Embed(description=fmt.format("RANK", "USERNAME", "RIGHT", "WRONG", "SUM", "RATE"))
-        author = "You have not yet made any predictions!" if user == interaction.user else f"{get_name(user)} has not yet made any predictions!"
+        num_users = await count_predictors(interaction.guild.id)
+        embed = await get_leaderboard_embed(interaction, user, 0)
+        if num_users > PAGE_SIZE:
+            await interaction.response.send_message(embed=embed, view=LeaderboardView(user, num_users), ephemeral=True)
+        else:
+            await interaction.response.send_message(embed=embed, ephemeral=True)
 
-        includes_user = user.id not in predictions
-        for i, (user_id, (won, lost)) in enumerate(sorted_predictions):
-            is_self = user_id == user.id
-
-            if i < 20 or is_self:
-                member = interaction.guild.get_member(user_id)
-                rank = "#" + str(i+1)
-                name = get_name(member).replace('`', '') if member else "Unknown user"
-                sum = won + lost
-                rate = won / sum
-                pct = "100%" if won == sum else f"{round(rate*100, 1)}%"
-                embed.description += ("\n" + fmt.format(rank, name[:25], won, lost, sum, pct))
-                if is_self:
-                    author = f"You have guessed right {won} times!" if user == interaction.user else f"{name} has guessed right {won} times!"
-                    includes_user = True
-
-                    if i == 0:
-                        author = "🏆 " + author
-                    elif i == 1:
-                        author = "🥈 " + author
-                    elif i == 2:
-                        author = "🥉 " + author
-
-            elif includes_user:
-                break
-            
-            elif i == 20:
-                embed.description += "\n..."
-        
-        embed.set_author(
-            name=author,
-            icon_url=user.avatar.url
-        )
-
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-    
-
-            
-
-        
-        
-                
 
 async def setup(bot):
     await bot.add_cog(predictions(bot))
\ No newline at end of file
@@ -0,0 +1,132 @@
+from typing import List, NamedTuple, Tuple
+import re
+
+from lib.maps import UnknownMap
+from lib.vote import MAPS, MAP_LOOKUP, Faction, MapState, MapVote, MiddleGroundVote, Team
+
+WORD_RE = re.compile(r"\w+")
+
+UNDO_COMMANDS = {'back', 'reverse', 'undo'}
+FACTIONS = {
+    'allies': Faction.Allies,
+    'us': Faction.Allies,
+    'rus': Faction.Allies,
+    'gb': Faction.Allies,
+    'axis': Faction.Axis,
+    'ger': Faction.Axis,
+}
+# Bans are separated by commas, ampersands, new lines, and dashes with spaces
+# around them or right after a faction, as in "Foy Axis-SME Allies". Other
+# dashes are kept, so that names like "Sainte-Mère-Église" stay intact.
+SEPARATOR_RE = re.compile(r"[,&\n]|\s+-\s*|\s*-\s+|(?:%s)-" % '|'.join(r"(?<=\b%s)" % name for name in FACTIONS))
+
+# Keywords and the value they stand for, in order of precedence
+MIDDLEGROUND_OPTIONS = [
+    ({'yes', 'middleground'}, MiddleGroundVote.Yes),
+    ({'no'}, MiddleGroundVote.No),
+]
+# Whether the team chooses to have the first ban
+FIRST_BAN_OPTIONS = [
+    ({'ban', 'extra'}, True),
+    ({'host', 'server'}, False),
+]
+FIRST_BAN_OPTIONS_MIDDLEGROUND = [
+    ({'extra'}, True),
+    ({'final'}, False),
+]
+
+
+class BanError(NamedTuple):
+    title: str
+    description: str
+
+class ParsedBans(NamedTuple):
+    bans: List[Tuple[Faction, int]]
+    errors: List[BanError]
+
+
+def parse_choice(content: str, options):
+    """Find which of the options the message picks, or None."""
+    words = set(WORD_RE.findall(content.lower()))
+    for keywords, value in options:
+        if not words.isdisjoint(keywords):
+            return value
+    return None
+
+def is_undo(content: str):
+    return content.strip().lower() in UNDO_COMMANDS
+
+def parse_bans(content: str, turns: int = None, vote: MapVote = None, team: Team = None):
+    """Parse a message like "Foy Axis, SME Allies" into (faction, map index)
+    pairs. Instead of stopping at the first mistake, every problem with
+    the message is collected so it can be reported all at once.
+
+    If a vote and team are given, bans of maps that are no longer
+    available are rejected as well.
+    """
+    bans = list()
+    errors = list()
+
+    segments = [segment.strip() for segment in SEPARATOR_RE.split(content.lower())]
+    segments = [segment for segment in segments if segment]
+    if not segments:
+        errors.append(BanError('Invalid ban!', 'Type a map followed by a faction, for example `%s Allies`.' % MAPS[0]))
+    if turns is not None and len(segments) > turns:
+        errors.append(BanError('Too many maps!', f'You can only ban {turns} more maps this turn!'))
+
+    for segment in segments:
+        map_name, _, faction_name = segment.rpartition(' ')
+
+        faction = FACTIONS.get(faction_name)
+        if faction is None or not map_name:
+            errors.append(BanError('Invalid faction!', f'"{segment}" has no valid faction. Available factions are Allies, Axis.'))
+            continue
+
+        try:
+            map_index = MAP_LOOKUP.resolve(map_name)
+        except UnknownMap as e:
+            if e.suggestions:
+                errors.append(BanError('Invalid map!', f'"{map_name}" is not a map. Did you mean {" or ".join(e.suggestions)}?'))
+            else:
+                errors.append(BanError('Invalid map!', 'Available maps are %s.' % ', '.join(MAPS)))
+            continue
+
+        map = MAPS[map_index]
+        if vote is not None and team is not None and vote.maps[team][faction].get_state(map_index) != MapState.Available:
+            errors.append(BanError(f'{map} {faction.name} was already banned!', 'Please pick another one.'))
+            continue
+
+        ban = (faction, map_index)
+        if ban in bans:
+            errors.append(BanError('You cannot ban the same map twice!', 'Please pick two unique maps.'))
+            continue
+        bans.append(ban)
+
+    return ParsedBans(bans, errors)
+
+
+if __name__ == "__main__":
+    # Benchmark the parse path, which runs for every message in a match channel
+    import time
+
+    vote = MapVote(data='4200,1221')
+    vote.ban(Team.One, Faction.Allies, 'Foy')
+    messages = [
+        "foy axis",
+        "Hurtgen Night Allies, SME Axis",
+        "foy nite axis & carentn allies",
+        "utah gb\nkursk ger",
+        "not a map allies",
+        "yes",
+        "undo",
+    ]
+
+    n = 20000
+    for message in messages:
+        start = time.perf_counter()
+        for _ in range(n):
+            if not is_undo(message):
+                parse_choice(message, MIDDLEGROUND_OPTIONS)
+                parse_bans(message, turns=2, vote=vote, team=Team.One)
+        elapsed = (time.perf_counter() - start) * 1e6 / n
+        print(f"{message!r: <38} {elapsed:.1f} µs")
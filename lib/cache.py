@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from pathlib import Path
+import tempfile
+import threading
+import os
+
+# Once the cache directory holds more images than allowed, the least
+# recently used ones are removed until this fraction of the limit is left,
+# so that the directory isn't scanned again on every write
+PRUNE_TO = 0.75
+
+class RenderCache:
+    """A bounded LRU cache of rendered images, keyed on a hash of
+    whatever was rendered. If a directory is given, images are also
+    written to disk so that they survive restarts, up to `max_files` of
+    them. A max_size of 0 disables the cache, on disk as well. Safe to use
+    from render worker threads."""
+
+    def __init__(self, max_size: int = 64, directory: str = None, max_files: int = 1000):
+        self.max_size = max_size
+        self.directory = Path(directory) if directory and max_size > 0 else None
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self._images: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._files = 0
+
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._files = sum(1 for _ in self.directory.glob('*.png'))
+
+    def __len__(self):
+        return len(self._images)
+
+    def _path(self, key: str):
+        return self.directory / f"{key}.png"
+
+    def peek(self, key: str):
+        """Look an image up in memory only, without touching the disk. Safe
+        to call from the event loop."""
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+            return img
+
+    def get(self, key: str):
+        """Look an image up in memory, and then on disk. As this may read a
+        file, call it from a worker thread."""
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return img
+
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    img = f.read()
+                # Mark it as recently used, so pruning keeps it around
+                os.utime(path)
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    self._store(key, img)
+                    self.hits += 1
+                return img
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, img: bytes):
+        with self._lock:
+            self._store(key, img)
+        if self.directory:
+            # Write to a temporary file first so a crash never leaves a half-written image behind
+            path = self._path(key)
+            try:
+                with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+                    f.write(img)
+                is_new = not path.exists()
+                os.replace(f.name, path)
+            except OSError as e:
+                print("Couldn't write rendered image to cache:", e)
+                return
+            if is_new:
+                with self._disk_lock:
+                    self._files += 1
+                    if self._files > self.max_files:
+                        self._prune()
+
+    def _prune(self):
+        """Remove the least recently used images from the cache directory."""
+        files = list()
+        for path in self.directory.glob('*.png'):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        files.sort()
+        keep = int(self.max_files * PRUNE_TO)
+        for _, path in files[:max(len(files) - keep, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self._files = sum(1 for _ in self.directory.glob('*.png'))
+
+    def _store(self, key: str, img: bytes):
+        if self.max_size <= 0:
+            return
+        self._images[key] = img
+        self._images.move_to_end(key)
+        while len(self._images) > self.max_size:
+            self._images.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return dict(
+            size=len(self._images),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=(self.hits / total) if total else 0.0,
+        )
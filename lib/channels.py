@@ -6,9 +6,11 @@ from random import randint
 from enum import StrEnum, auto
 import re
 
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Dict
 
-from lib.vote import MapVote, MAPS, Team, Faction, Action, MapState, MiddleGroundVote
+from lib.progress import ProgressLog
+from lib.vote import MapVote, MAPS, Team, Faction, Action, MiddleGroundVote
 from lib.streams import Stream
 from utils import get_config, unpack_cfg_list
 
@@ -42,94 +44,144 @@ print("Middleground method:", MIDDLEGROUND_METHOD)
 print("Regions:", MIDDLEGROUND_REGIONS)
 print("Matchups:", MIDDLEGROUND_MATCHUPS)
 
-import sqlite3
-db = sqlite3.connect('seasonal.db')
+from lib.db import db, database, write_behind
 cur = db.cursor()
 
-cur.execute("""CREATE TABLE IF NOT EXISTS "channels" (
-	"creation_time"	TEXT,
-	"guild_id"	INTEGER,
-	"channel_id"	INTEGER,
-	"message_id"	INTEGER,
-	"title"	TEXT,
-	"desc"	TEXT,
-	"match_start"	TEXT,
-	"map"	TEXT,
-	"team1"	TEXT,
-	"team2"	TEXT,
-	"banner_url"	TEXT,
-	"has_vote"	INTEGER,
-	"has_predictions"	INTEGER,
-	"result"	TEXT,
-	"vote_result"	TEXT,
-	"vote_coinflip_option"	INTEGER,
-	"vote_coinflip"	INTEGER,
-	"vote_server_option"	INTEGER,
-	"vote_server"	TEXT,
-	"vote_first_ban"	INTEGER,
-	"vote_progress"	TEXT,
-	"predictions_team1"	TEXT,
-	"predictions_team2"	TEXT,
-	"predictions_team1_emoji"	TEXT,
-	"predictions_team2_emoji"	TEXT,
-	"stream_delay"	INTEGER,
-	PRIMARY KEY("channel_id")
-);""")
-db.commit()
-
-def get_all_channels(guild_id):
-    cur.execute('SELECT channel_id FROM channels WHERE guild_id = ?', (guild_id,))
-    res = cur.fetchall()
-    return [MatchChannel(channel_id[0]) for channel_id in res]
-
-def get_predictions(guild_id: int):
-    cur.execute('SELECT predictions_team1, predictions_team2, result FROM channels WHERE guild_id = ? AND result IS NOT NULL', (guild_id,))
-
-    results: Dict[int, List[int]] = dict()
-    for t1_pred, t2_pred, result in cur.fetchall():
-        t1_pred = [int(user_id) for user_id in t1_pred.split(',') if user_id]
-        t2_pred = [int(user_id) for user_id in t2_pred.split(',') if user_id]
-
-        match = re.match(r"(\d) *[-:] *(\d)", result)
-        if not match:
-            continue
-        t1_score, t2_score = [int(score) for score in match.groups()]
-        winner = t1_score > t2_score
-
-        for won, preds in ((winner, t1_pred), (not winner, t2_pred)):
-            for pred in preds:
-                scores = results.setdefault(pred, [0, 0])
-                if won:
-                    scores[0] += 1
-                else:
-                    scores[1] += 1
-
-    return results
+def get_winner(result: str):
+    """Get which team won according to a result like "5 - 0", or None if
+    it isn't a score."""
+    match = re.match(r"(\d) *[-:] *(\d)", result or '')
+    if not match:
+        return None
+    t1_score, t2_score = [int(score) for score in match.groups()]
+    return 1 if t1_score > t2_score else 2
+
+# Add (+) or remove (-) the predictions of a match to the scores of its
+# guild, based on the winner that was last scored for it
+UPDATE_SCORES = '''INSERT INTO prediction_scores (guild_id, user_id, won, lost)
+    SELECT c.guild_id, p.user_id, %(sign)s(p.team = c.prediction_winner), %(sign)s(p.team != c.prediction_winner)
+    FROM predictions p JOIN channels c ON c.channel_id = p.channel_id
+    WHERE p.channel_id = ? AND c.prediction_winner IS NOT NULL
+    ON CONFLICT (guild_id, user_id) DO UPDATE SET won = won + excluded.won, lost = lost + excluded.lost'''
+ADD_SCORES = UPDATE_SCORES % dict(sign='+')
+REMOVE_SCORES = UPDATE_SCORES % dict(sign='-')
+
+# IDs of all match channels, so other channels can be ignored without a query
+cur.execute('SELECT channel_id FROM channels')
+MATCH_CHANNEL_IDS = {channel_id for channel_id, in cur.fetchall()}
+
+def is_match_channel(channel_id: int):
+    return channel_id in MATCH_CHANNEL_IDS
+
+async def get_all_channels(guild_id):
+    """Load all matches of a guild together with their streams, in two queries."""
+    rows = await database.fetchall('SELECT * FROM channels WHERE guild_id = ?', (guild_id,))
+    matches = [MatchChannel.from_row(row) for row in rows]
+    await Stream.in_channels([match.channel_id for match in matches])
+    return matches
+
+# Leaderboard order: most right predictions first, then least wrong ones.
+# Matches the prediction_scores_rank index, so no sorting is needed.
+async def get_leaderboard(guild_id: int, offset: int = 0, limit: int = 20):
+    """Get (user ID, won, lost) of a page of the predictions leaderboard."""
+    return await database.fetchall('''SELECT user_id, won, lost FROM prediction_scores
+        WHERE guild_id = ? AND won + lost > 0
+        ORDER BY won DESC, lost ASC, user_id ASC
+        LIMIT ? OFFSET ?''', (guild_id, limit, offset))
+
+async def count_predictors(guild_id: int):
+    (count,) = await database.fetchone('SELECT COUNT(*) FROM prediction_scores WHERE guild_id = ? AND won + lost > 0', (guild_id,))
+    return count
+
+async def get_prediction_rank(guild_id: int, user_id: int):
+    """Get (rank, won, lost) of a user on the predictions leaderboard, with
+    1 being the highest rank, or None if they haven't predicted anything."""
+    res = await database.fetchone('SELECT won, lost FROM prediction_scores WHERE guild_id = ? AND user_id = ? AND won + lost > 0', (guild_id, user_id))
+    if not res:
+        return None
+    won, lost = res
+    # Count everyone ahead of them, which only scans that part of the index
+    (ahead,) = await database.fetchone('''SELECT COUNT(*) FROM prediction_scores
+        WHERE guild_id = ? AND won + lost > 0
+        AND (won > ? OR (won = ? AND (lost < ? OR (lost = ? AND user_id < ?))))''',
+        (guild_id, won, won, lost, lost, user_id))
+    return (ahead + 1, won, lost)
+
+
+# Live MatchChannel objects by channel ID, least recently used first
+MATCH_CACHE: OrderedDict[int, 'MatchChannel'] = OrderedDict()
+MATCH_CACHE_SIZE = 256
+
+def _cache_match(match: 'MatchChannel'):
+    MATCH_CACHE[match.channel_id] = match
+    MATCH_CACHE.move_to_end(match.channel_id)
+    while len(MATCH_CACHE) > MATCH_CACHE_SIZE:
+        MATCH_CACHE.popitem(last=False)
+
+
+def _get_cached_match(channel_id: int):
+    match = MATCH_CACHE.get(channel_id)
+    if match is None:
+        # Evicted from the cache, but its latest changes aren't written yet
+        match = write_behind.get_pending(('channels', channel_id))
+        if match is None:
+            return None
+    _cache_match(match)
+    return match
 
 
 class MatchChannel:
+    def __new__(cls, channel_id):
+        # Return the live object if this match was loaded before
+        match = _get_cached_match(channel_id)
+        if match is not None:
+            return match
+        return super().__new__(cls)
+
     def __init__(self, channel_id):
+        if getattr(self, '_loaded', False):
+            return
+
         cur.execute('SELECT * FROM channels WHERE channel_id = ?', (channel_id,))
         res = cur.fetchone()
         if not res: raise NotFound("There is no match attached to channel %s" % channel_id)
+        self._load(res)
 
+    @classmethod
+    def from_row(cls, row):
+        """Get the match of a row of the channels table, unless it's already loaded."""
+        match = _get_cached_match(row[2])
+        if match is None:
+            match = object.__new__(cls)
+            match._load(row)
+        return match
+
+    def _load(self, row):
         (self.creation_time, self.guild_id, self.channel_id, self.message_id, self.title, self.desc, self.match_start,
         self.map, self.team1, self.team2, self.banner_url, self.has_vote, self.has_predictions, self.result, self.vote_result,
         self.vote_coinflip_option, self.vote_coinflip, self.vote_server_option, self.vote_server, self.vote_first_ban, self.vote_progress,
-        self.predictions_team1, self.predictions_team2, self.predictions_team1_emoji, self.predictions_team2_emoji, self.stream_delay) = res
+        self.predictions_team1, self.predictions_team2, self.predictions_team1_emoji, self.predictions_team2_emoji, self.stream_delay, self.vote_snapshot, self.prediction_winner) = row
 
         self.creation_time = datetime.fromisoformat(self.creation_time) if self.creation_time else datetime.now()
         self.match_start = datetime.fromisoformat(self.match_start) if self.match_start else None
         self.has_vote = bool(self.has_vote)
         self.has_predictions = bool(self.has_predictions)
 
-        self.vote = MapVote(team1=self.team1, team2=self.team2, data=self.vote_progress)
+        self.vote = MapVote(team1=self.team1, team2=self.team2, data=self.vote_progress, snapshot=self.vote_snapshot)
 
-        self.predictions_team1 = self.predictions_team1.split(',') if self.predictions_team1 else []
-        self.predictions_team2 = self.predictions_team2.split(',') if self.predictions_team2 else []
+        # Loaded from the predictions table once they are needed
+        self._predictions: Dict[int, int] = None
+        self._prediction_counts = {1: 0, 2: 0}
+        self._changed_predictions: Dict[int, int] = dict()
+        self._predictions_reset = False
+
+        # What the row in the database looks like, to find out what save() has to write
+        self._saved = self._get_columns()
+        self._loaded = True
+        _cache_match(self)
 
     @classmethod
-    def new(cls, channel, title: str, desc: str, match_start: datetime = None, map=None, team1 = None, team2 = None, banner_url: str = None, has_vote: bool = False, has_predictions: bool = False, result: str = None):
+    async def new(cls, channel, title: str, desc: str, match_start: datetime = None, map=None, team1 = None, team2 = None, banner_url: str = None, has_vote: bool = False, has_predictions: bool = False, result: str = None):
         creation_time = datetime.now()
         channel_id = channel.id
         guild_id = channel.guild.id
@@ -142,40 +194,128 @@ class MatchChannel:
         vote_server_option = 0
         vote_server = None
         vote_first_ban = None
-        vote_progress = MIDDLEGROUND_DEFAULT_VOTE_PROGRESS
+        vote_progress = ProgressLog(MIDDLEGROUND_DEFAULT_VOTE_PROGRESS).to_bytes()
         predictions_team1 = ''
         predictions_team2 = ''
         predictions_team1_emoji = get_config()['visuals']['DefaultTeam1Emoji']
         predictions_team2_emoji = get_config()['visuals']['DefaultTeam2Emoji']
         stream_delay = 0
-        cur.execute(
-            "INSERT INTO channels VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        vote_snapshot = None
+        prediction_winner = None
+        await database.execute(
+            "INSERT INTO channels VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
             (creation_time, guild_id, channel_id, message_id, title, desc, match_start, map, team1, team2, banner_url, int(has_vote), int(has_predictions), result,
             vote_result, vote_coinflip_option, vote_coinflip, vote_server_option, vote_server, vote_first_ban, vote_progress,
-            predictions_team1, predictions_team2, predictions_team1_emoji, predictions_team2_emoji, stream_delay)
+            predictions_team1, predictions_team2, predictions_team1_emoji, predictions_team2_emoji, stream_delay, vote_snapshot, prediction_winner)
         )
-        db.commit()
+        MATCH_CHANNEL_IDS.add(channel_id)
         return cls(channel_id)
 
-    def save(self):
-        self.vote_progress = ','.join(self.vote.progress)
-        cur.execute("""UPDATE channels SET
-        creation_time = ?, message_id = ?, title = ?, desc = ?, match_start = ?, map = ?, team1 = ?, team2 = ?,
-        banner_url = ?, has_vote = ?, has_predictions = ?, result = ?, vote_result = ?, vote_coinflip_option = ?,
-        vote_coinflip = ?, vote_server_option = ?, vote_server = ?, vote_first_ban = ?, vote_progress = ?, predictions_team1 = ?,
-        predictions_team2 = ?, predictions_team1_emoji = ?, predictions_team2_emoji = ?, stream_delay = ? WHERE channel_id = ?""",
-        (self.creation_time.isoformat(), self.message_id, self.title, self.desc, self.match_start.isoformat() if isinstance(self.match_start, datetime) else None,
-        self.map, self.team1, self.team2, self.banner_url, int(self.has_vote), int(self.has_predictions), self.result,
-        self.vote_result, self.vote_coinflip_option, self.vote_coinflip, self.vote_server_option, self.vote_server, self.vote_first_ban, self.vote_progress,
-        ','.join(self.predictions_team1), ','.join(self.predictions_team2), self.predictions_team1_emoji, self.predictions_team2_emoji,
-        self.stream_delay, self.channel_id))
-        db.commit()
-
-    def delete(self):
-        cur.execute("""DELETE FROM channels WHERE channel_id = ?""", (self.channel_id,))
-        db.commit()
+    def _get_columns(self):
+        """Get the values of the columns that are written by `save()`."""
+        return {
+            'creation_time': self.creation_time.isoformat(),
+            'message_id': self.message_id,
+            'title': self.title,
+            'desc': self.desc,
+            'match_start': self.match_start.isoformat() if isinstance(self.match_start, datetime) else None,
+            'map': self.map,
+            'team1': self.team1,
+            'team2': self.team2,
+            'banner_url': self.banner_url,
+            'has_vote': int(self.has_vote),
+            'has_predictions': int(self.has_predictions),
+            'result': self.result,
+            'vote_result': self.vote_result,
+            'vote_coinflip_option': self.vote_coinflip_option,
+            'vote_coinflip': self.vote_coinflip,
+            'vote_server_option': self.vote_server_option,
+            'vote_server': self.vote_server,
+            'vote_first_ban': self.vote_first_ban,
+            'vote_progress': self.vote.progress.to_bytes(),
+            'predictions_team1_emoji': self.predictions_team1_emoji,
+            'predictions_team2_emoji': self.predictions_team2_emoji,
+            'stream_delay': self.stream_delay,
+        }
+
+    def _take_changes(self):
+        """Get the statements that write the columns and predictions that
+        changed since the match was loaded or last saved, and consider them
+        saved."""
+        columns = self._get_columns()
+        changes = {key: value for key, value in columns.items() if self._saved.get(key) != value}
+        predictions_changed = self._predictions_reset or self._changed_predictions
+        if not (changes or predictions_changed):
+            return []
+        if 'vote_progress' in changes:
+            self.vote_progress = changes['vote_progress']
+            self.vote_snapshot = changes['vote_snapshot'] = self.vote.get_snapshot()
+
+        statements = list()
+        # The scores only have to be updated if the result or the predictions of a finished match change
+        rescore = 'result' in changes or (predictions_changed and (self.prediction_winner or get_winner(self.result)))
+        if rescore:
+            statements.append((REMOVE_SCORES, (self.channel_id,)))
+
+        if self._predictions_reset:
+            statements.append(('DELETE FROM predictions WHERE channel_id = ?', (self.channel_id,)))
+            changed_predictions = self._predictions or dict()
+        else:
+            changed_predictions = self._changed_predictions
+        statements += [('INSERT OR REPLACE INTO predictions VALUES (?,?,?)', (self.channel_id, user_id, team))
+                       for user_id, team in changed_predictions.items()]
+
+        if rescore:
+            self.prediction_winner = get_winner(self.result)
+            statements.append(('UPDATE channels SET prediction_winner = ? WHERE channel_id = ?', (self.prediction_winner, self.channel_id)))
+            statements.append((ADD_SCORES, (self.channel_id,)))
+
+        if changes:
+            statements.append(('UPDATE channels SET %s WHERE channel_id = ?' % ', '.join('"%s" = ?' % key for key in changes),
+                               (*changes.values(), self.channel_id)))
+
+        # Saves that start while this one is queued only have to write what changed after it
+        self._saved = columns
+        self._changed_predictions = dict()
+        self._predictions_reset = False
+        return statements
+
+    def _forget_saved(self):
+        # Write everything again next time
+        self._saved = dict()
+        self._predictions_reset = self._predictions is not None
+
+    async def save(self):
+        """Write the columns that changed since the match was loaded or last
+        saved. Nothing is written if nothing changed."""
+        statements = self._take_changes()
+        if statements:
+            try:
+                await database.execute_batch(statements)
+            except:
+                self._forget_saved()
+                raise
+        # Whatever was just written is now the live state of this match
+        _cache_match(self)
+
+    def save_later(self):
+        """Like `save()`, but the changes may be held back for a moment to be
+        written together with other frequent changes, like predictions."""
+        write_behind.schedule(('channels', self.channel_id), self, self._take_changes, on_failed=self._forget_saved)
+        _cache_match(self)
+
+    async def delete(self):
+        # Held back changes would otherwise bring the match back after all
+        write_behind.discard(('channels', self.channel_id))
+        await database.execute_batch([
+            (REMOVE_SCORES, (self.channel_id,)),
+            ('DELETE FROM predictions WHERE channel_id = ?', (self.channel_id,)),
+            ("""DELETE FROM channels WHERE channel_id = ?""", (self.channel_id,)),
+        ])
+        MATCH_CACHE.pop(self.channel_id, None)
+        MATCH_CHANNEL_IDS.discard(self.channel_id)
         for stream in self.get_streams():
-            stream.delete()
+            await stream.delete()
 
     async def get_channel(self, ctx):
         try: return await commands.TextChannelConverter().convert(ctx, self.channel_id)
@@ -281,7 +421,7 @@ class MatchChannel:
             elif self.vote_coinflip_option in [1, 2]:
                 self.vote_coinflip = self.vote_coinflip_option
             self.vote.add_progress(team=self.vote_coinflip, action=4, faction=0, map_index=0)
-            self.save()
+            await self.save()
         
         team1 = self.get_team1(ctx)
         team2 = self.get_team2(ctx)
@@ -305,7 +445,7 @@ class MatchChannel:
                 self.vote_server = '2' if self.vote_first_ban == 1 else '1'
             elif self.vote_server_option in [1, 2]:
                 self.vote_server = str(self.vote_server_option)
-            self.save()
+            await self.save()
 
         if self.vote_server == '1':
             server_host = team1
@@ -327,7 +467,7 @@ class MatchChannel:
             embed.add_field(inline=True, name='🔨 Extra Ban', value=first_ban)
             embed.add_field(inline=True, name='💻 Server Host', value=server_host)
 
-        embed.description = self.parse_progress(self.vote_progress, self.get_team1(ctx), self.get_team2(ctx))
+        embed.description = self.parse_progress(self.vote.progress, self.get_team1(ctx), self.get_team2(ctx))
 
         if not self.vote_result:
             team, turns = self.get_turn()
@@ -357,7 +497,7 @@ class MatchChannel:
         self.vote.names[Team.Two] = self.get_team2(ctx, mention=False)
 
         if render_images:
-            img = self.vote.render()
+            img = await self.vote.render_async(self.channel_id)
             file = discord.File(img, filename='output.png')
         else:
             file = None
@@ -367,7 +507,7 @@ class MatchChannel:
     async def to_predictions_embed(self, ctx, delay_predictions=False):
         # Predictions
         embed = discord.Embed(title='Match Predictions')
-        embed.description = f'_ _\n{self.predictions_team1_emoji} {self.get_team1(ctx)} (**{len(self.predictions_team1)}** votes)\n{self.predictions_team2_emoji} {self.get_team2(ctx)} (**{len(self.predictions_team2)}** votes)'
+        embed.description = f'_ _\n{self.predictions_team1_emoji} {self.get_team1(ctx)} (**{self.get_prediction_count(1)}** votes)\n{self.predictions_team2_emoji} {self.get_team2(ctx)} (**{self.get_prediction_count(2)}** votes)'
 
         if not self.should_have_predictions():
             embed.set_footer(text='Voting has ended')
@@ -391,14 +531,39 @@ class MatchChannel:
     def should_show_predictions(self):
         return self.has_predictions and not (self.has_vote and not self.vote_result)
 
+    def _load_predictions(self):
+        if self._predictions is None:
+            cur.execute('SELECT user_id, team FROM predictions WHERE channel_id = ?', (self.channel_id,))
+            self._predictions = dict(cur.fetchall())
+            for team in self._predictions.values():
+                self._prediction_counts[team] += 1
+        return self._predictions
+
     def get_prediction_of_user(self, user_id):
-        user_id = str(user_id)
-        if user_id in self.predictions_team1:
-            return 1
-        elif user_id in self.predictions_team2:
-            return 2
-        else:
-            return None
+        return self._load_predictions().get(int(user_id))
+
+    def get_prediction_count(self, team: int):
+        self._load_predictions()
+        return self._prediction_counts[team]
+
+    def set_prediction(self, user_id, team: int):
+        """Change which team a user predicts to win."""
+        predictions = self._load_predictions()
+        user_id = int(user_id)
+        old = predictions.get(user_id)
+        if old == team:
+            return
+        if old is not None:
+            self._prediction_counts[old] -= 1
+        predictions[user_id] = team
+        self._prediction_counts[team] += 1
+        self._changed_predictions[user_id] = team
+
+    def reset_predictions(self):
+        self._predictions = dict()
+        self._prediction_counts = {1: 0, 2: 0}
+        self._changed_predictions = dict()
+        self._predictions_reset = True
 
     def get_turn(self):
         if self.use_middleground_server() is True:
@@ -450,39 +615,40 @@ class MatchChannel:
                 
         return None
 
-    def vote_middleground(self, team: Team, vote: MiddleGroundVote):
+    async def vote_middleground(self, team: Team, vote: MiddleGroundVote):
         self.vote.vote_middleground(team, vote)
         if self.use_middleground_server() is True:
             self.vote_server = "Middleground"
-        self.save()
-    def ban_map(self, team: Team, faction: Faction, map: str):
+        await self.save()
+    async def ban_map(self, team: Team, faction: Faction, map: str, save: bool = True):
         team = Team(team)
         faction = Faction(faction)
         self.vote.ban(team, faction, map)
-        if str(self.vote).count('0') == 2:
+        if self.vote.num_available() == 2:
             for team, data in self.vote.maps.items():
                 for faction, column in data.items():
-                    for map, state in column.items():
-                        if state == MapState.Available:
-                            self.vote.final_pick(team=team, faction=faction, map=map)
-                            if not self.vote_result:
-                                if team.value == faction.value:
-                                    self.vote_result = map
-                                else:
-                                    self.vote_result = '!' + map
-                                self.map = map
-                            break
-        self.save()
-    def undo(self, amount: int = 1):
+                    for map_index in column.available():
+                        map = MAPS[map_index]
+                        self.vote.final_pick(team=team, faction=faction, map=map)
+                        if not self.vote_result:
+                            if team.value == faction.value:
+                                self.vote_result = map
+                            else:
+                                self.vote_result = '!' + map
+                            self.map = map
+                        break
+        if save:
+            await self.save()
+    async def undo(self, amount: int = 1):
         for i in range(amount):
             if not len(self.vote.progress) > 3:
                 break
-            del self.vote.progress[-2:]
-        self.save()
+            self.vote.undo(2)
+        await self.save()
 
     def parse_progress(self, progress, team1, team2):
         output = list()
-        for item in progress.split(','):
+        for item in progress:
             if item:
                 action = self._parse_individual_progress(item, team1, team2)
                 if action:
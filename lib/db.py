@@ -0,0 +1,298 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+import asyncio
+import bisect
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from lib.migrations import migrate
+from utils import get_config
+
+DB_PATH = 'seasonal.db'
+# Number of prepared statements that are kept around for reuse
+STATEMENT_CACHE_SIZE = 256
+# Number of threads, each with their own connection, that run reads
+READER_THREADS = 4
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+"?(\w+)', re.IGNORECASE)
+
+
+def _connect(path: str, isolation_level=''):
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, isolation_level=isolation_level, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA busy_timeout = 5000')
+    return conn
+
+def get_query_type(sql: str):
+    """Get a short name for a query to group its statistics by, like "UPDATE channels"."""
+    verb = sql.split(None, 1)[0].upper()
+    table = TABLE_RE.search(sql)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, latency: float):
+        ms = latency * 1000
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, ms)] += 1
+        self.total += 1
+        self.total_time += ms
+        if ms > self.max_time:
+            self.max_time = ms
+
+    def percentile(self, pct: float):
+        """Get the upper bound of the bucket that the given percentile falls in, in ms."""
+        if not self.total:
+            return 0.0
+        needed = self.total * pct / 100
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= needed:
+                return float(bound)
+        return self.max_time
+
+    def __str__(self):
+        avg = self.total_time / self.total if self.total else 0.0
+        return f"n={self.total} avg={avg:.1f}ms p50<={self.percentile(50):.0f}ms p99<={self.percentile(99):.0f}ms max={self.max_time:.1f}ms"
+
+
+class Database:
+    """Runs queries on background threads, so that a slow disk never blocks
+    the event loop.
+
+    All writes go through a single writer thread. Everything that queued up
+    while it was busy is committed together, each write in its own savepoint
+    so that one failing statement doesn't take the others down with it.
+    Reads run concurrently on a small pool of connections of their own.
+    """
+
+    def __init__(self, path: str = DB_PATH, readers: int = READER_THREADS):
+        self.path = path
+        self.histograms = defaultdict(LatencyHistogram)
+
+        self._writes = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+        self._writer.start()
+
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+
+    async def execute(self, sql: str, params: Iterable = ()):
+        """Run a single write. Returns the row ID of the last inserted row."""
+        return await self.execute_batch([(sql, params)], query_type=get_query_type(sql))
+
+    async def execute_batch(self, statements: Iterable[Tuple[str, Iterable]], query_type: str = None):
+        """Run several writes as one atomic unit. Returns the row ID of the
+        last inserted row."""
+        statements = list(statements)
+        if not statements:
+            return None
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        query_type = query_type or get_query_type(statements[0][0])
+        self._writes.put((statements, loop, fut, query_type, time.perf_counter()))
+        return await fut
+
+    async def fetchone(self, sql: str, params: Iterable = ()):
+        return await self._read(sql, params, one=True)
+
+    async def fetchall(self, sql: str, params: Iterable = ()):
+        return await self._read(sql, params, one=False)
+
+    async def _read(self, sql: str, params: Iterable, one: bool):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._readers, self._run_read, sql, tuple(params), one)
+        finally:
+            self.histograms[get_query_type(sql)].record(time.perf_counter() - start)
+
+    def _run_read(self, sql: str, params: tuple, one: bool):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+            conn.execute('PRAGMA query_only = ON')
+        cur = conn.execute(sql, params)
+        return cur.fetchone() if one else cur.fetchall()
+
+    def _write_loop(self):
+        conn = _connect(self.path, isolation_level=None)
+        running = True
+        while running:
+            jobs = [self._writes.get()]
+            # Take along everything else that is already waiting
+            while True:
+                try:
+                    jobs.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            if None in jobs:
+                running = False
+                jobs = [job for job in jobs if job is not None]
+            if not jobs:
+                continue
+
+            results = list()
+            try:
+                conn.execute('BEGIN')
+                for statements, *_ in jobs:
+                    conn.execute('SAVEPOINT job')
+                    try:
+                        cur = None
+                        for sql, params in statements:
+                            cur = conn.execute(sql, tuple(params))
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO job')
+                        results.append((None, e))
+                    else:
+                        results.append((cur.lastrowid, None))
+                    conn.execute('RELEASE job')
+                conn.execute('COMMIT')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                results = [(None, e)] * len(jobs)
+
+            end = time.perf_counter()
+            for (_, loop, fut, query_type, start), (res, exc) in zip(jobs, results):
+                try:
+                    loop.call_soon_threadsafe(self._finish, fut, res, exc, query_type, end - start)
+                except RuntimeError:
+                    # The event loop was closed in the meantime
+                    pass
+        conn.close()
+
+    def _finish(self, fut: asyncio.Future, res, exc, query_type: str, latency: float):
+        self.histograms[query_type].record(latency)
+        if fut.done():
+            return
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(res)
+
+    def stats(self):
+        return {query_type: str(histogram) for query_type, histogram in sorted(self.histograms.items())}
+
+    def close(self):
+        """Finish all queued writes and stop the background threads."""
+        self._writes.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+
+
+class WriteBehind:
+    """Holds back frequent writes, like prediction and poll votes, for a
+    short while. Repeated updates of the same row within that time are
+    written only once, and everything is committed together.
+
+    Writes are scheduled with a key identifying the row, the object that
+    holds its data, and a function that returns the statements to write
+    it. That function is only called when the writes are flushed, so
+    they always contain the latest state.
+    """
+
+    def __init__(self, database: Database, max_staleness: float = 2.0, flush_on_close: bool = True):
+        self.database = database
+        self.max_staleness = max_staleness
+        self.flush_on_close = flush_on_close
+        self._pending: Dict[Hashable, Tuple[object, Callable[[], List[Tuple[str, Iterable]]], Callable]] = dict()
+        self._task: asyncio.Task = None
+
+        self.scheduled = 0
+        self.written = 0
+        self.failed = 0
+
+    def schedule(self, key: Hashable, obj, get_statements: Callable[[], List[Tuple[str, Iterable]]], on_failed: Callable = None):
+        self.scheduled += 1
+        self._pending[key] = (obj, get_statements, on_failed)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    def get_pending(self, key: Hashable):
+        """Get the object of a row that still has to be written, if any."""
+        entry = self._pending.get(key)
+        return entry[0] if entry else None
+
+    def discard(self, key: Hashable):
+        """Drop the pending write of a row, for instance because it is about
+        to be deleted."""
+        self._pending.pop(key, None)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_staleness)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, dict()
+        if not pending:
+            return
+        # Build every batch first, so that one that can't be built doesn't
+        # take the others down with it
+        writes = list()
+        for _, get_statements, on_failed in pending.values():
+            try:
+                writes.append((self.database.execute_batch(get_statements(), query_type='write-behind'), on_failed))
+            except Exception as e:
+                self._fail(e, on_failed)
+        # All of these are queued at once, so the writer commits them together
+        results = await asyncio.gather(*[write for write, _ in writes], return_exceptions=True)
+        for (_, on_failed), res in zip(writes, results):
+            if isinstance(res, Exception):
+                self._fail(res, on_failed)
+            else:
+                self.written += 1
+
+    def _fail(self, exc: Exception, on_failed: Callable = None):
+        self.failed += 1
+        print('Failed to write held back changes:', exc.__class__.__name__, exc)
+        if on_failed:
+            on_failed()
+
+    async def close(self):
+        """Stop holding back writes, and write whatever is still pending if
+        so configured."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+        if self.flush_on_close:
+            await self.flush()
+        elif self._pending:
+            print(f'Discarding {len(self._pending)} held back writes')
+            self._pending.clear()
+
+    @property
+    def stats(self):
+        return dict(
+            pending=len(self._pending),
+            scheduled=self.scheduled,
+            written=self.written,
+            failed=self.failed,
+        )
+
+
+# Connection for the schema setup at startup and for the few reads that
+# have to happen synchronously
+db = _connect(DB_PATH)
+migrate(db)
+
+# Everything else should go through here
+database = Database(DB_PATH)
+
+write_behind = WriteBehind(
+    database,
+    max_staleness=get_config().getfloat('database', 'MaxStaleness', fallback=2.0),
+    flush_on_close=get_config().getboolean('database', 'FlushOnClose', fallback=True),
+)
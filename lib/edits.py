@@ -0,0 +1,155 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Tuple
+import asyncio
+import time
+
+# Discord allows about this many message edits per channel within the
+# window (in seconds) before it starts rate limiting them
+EDITS_PER_WINDOW = 5
+EDIT_WINDOW = 5.0
+# Channels can only be renamed twice every 10 minutes
+RENAMES_PER_WINDOW = 2
+RENAME_WINDOW = 600.0
+
+
+class EditScheduler:
+    """Edits messages or channels in the background, no more often than the
+    rate limits allow.
+
+    Every message or channel has at most one edit waiting. Scheduling
+    another one for it before it ran replaces it, so ten quick changes
+    result in one edit with the latest state. Edits are done by a function
+    that builds the new state when it is called, so whatever runs last is
+    always up to date.
+
+    Flags given when scheduling are combined with those of the edit that
+    was replaced, so that for instance a requested image render isn't lost
+    when a plain edit comes in right after. They are passed on to the
+    function as keyword arguments.
+
+    If the function finds there is nothing to change after all, it can
+    return False, and the edit doesn't count towards the rate limit.
+    """
+
+    def __init__(self, edits_per_window: int = EDITS_PER_WINDOW, window: float = EDIT_WINDOW):
+        self.edits_per_window = edits_per_window
+        self.window = window
+        self._pending: Dict[Hashable, Tuple[Hashable, Callable[..., Awaitable], Dict[str, bool]]] = dict()
+        self._workers: Dict[Hashable, asyncio.Task] = dict()
+        # When the last few edits in each rate limit bucket were made
+        self._history: Dict[Hashable, Deque[float]] = dict()
+
+        self.scheduled = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def schedule(self, key: Hashable, bucket: Hashable, edit: Callable[..., Awaitable], **flags: bool):
+        """Schedule an edit of whatever is identified by `key`. The bucket is
+        what Discord rate limits the edit by, which for messages is their
+        channel."""
+        self.scheduled += 1
+        pending = self._pending.get(key)
+        if pending:
+            flags = {flag: flags.get(flag, False) or pending[2].get(flag, False) for flag in {*flags, *pending[2]}}
+        self._pending[key] = (bucket, edit, flags)
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.get_running_loop().create_task(self._run(key))
+
+    def is_pending(self, key: Hashable):
+        return key in self._pending or key in self._workers
+
+    async def _run(self, key: Hashable):
+        try:
+            while key in self._pending:
+                bucket = self._pending[key][0]
+                slot = await self._wait_for_budget(bucket)
+                # Only take the edit now, in case it was replaced while waiting
+                _, edit, flags = self._pending.pop(key)
+                try:
+                    res = await edit(**flags)
+                except Exception as e:
+                    self.failed += 1
+                    print('Failed to make scheduled edit:', e.__class__.__name__, e)
+                else:
+                    if res is False:
+                        self.skipped += 1
+                        self._history[bucket].remove(slot)
+                    else:
+                        self.written += 1
+        finally:
+            del self._workers[key]
+
+    async def _wait_for_budget(self, bucket: Hashable):
+        history = self._history.setdefault(bucket, deque(maxlen=self.edits_per_window))
+        while len(history) == self.edits_per_window and time.monotonic() - history[0] < self.window:
+            await asyncio.sleep(history[0] + self.window - time.monotonic())
+        slot = time.monotonic()
+        history.append(slot)
+        return slot
+
+    async def close(self, wait: bool = True):
+        """Wait for all scheduled edits to be made, or discard them."""
+        if not wait:
+            if self._pending:
+                print(f'Discarding {len(self._pending)} scheduled edits')
+            self._pending.clear()
+            for worker in self._workers.values():
+                worker.cancel()
+        while self._workers:
+            workers = list(self._workers.items())
+            await asyncio.gather(*[worker for _, worker in workers], return_exceptions=True)
+            # Workers that were cancelled before they started never remove themselves
+            for key, worker in workers:
+                if self._workers.get(key) is worker:
+                    del self._workers[key]
+
+    @property
+    def backlog(self):
+        """The number of edits that are waiting to be made."""
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        return dict(
+            pending=self.backlog,
+            scheduled=self.scheduled,
+            written=self.written,
+            skipped=self.skipped,
+            coalesced=self.scheduled - self.written - self.skipped - self.failed - self.backlog,
+            failed=self.failed,
+        )
+
+
+message_edits = EditScheduler()
+channel_renames = EditScheduler(RENAMES_PER_WINDOW, RENAME_WINDOW)
+
+
+if __name__ == "__main__":
+    # Simulate a burst of prediction clicks on a handful of match messages
+    import random
+
+    async def main():
+        scheduler = EditScheduler()
+        written = dict()
+        states = dict()
+
+        def make_edit(key):
+            async def edit(update_image=False):
+                await asyncio.sleep(0.01)
+                written[key] = (states[key], update_image)
+            return edit
+
+        start = time.monotonic()
+        for i in range(200):
+            key = random.randrange(5)
+            states[key] = i
+            scheduler.schedule(key, bucket=key, edit=make_edit(key), update_image=i % 50 == 0)
+            await asyncio.sleep(0.005)
+        await scheduler.close()
+
+        assert all(written[key][0] == states[key] for key in states)
+        print(f"{scheduler.stats} in {time.monotonic() - start:.2f}s")
+
+    asyncio.run(main())
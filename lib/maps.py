@@ -0,0 +1,135 @@
+from typing import Dict, List
+
+RESOLVE_CACHE_SIZE = 1024
+
+class UnknownMap(ValueError):
+    """Raised when a name can't be resolved to a map"""
+    def __init__(self, name: str, suggestions: List[str] = None):
+        self.name = name
+        self.suggestions = suggestions or []
+        super().__init__("Unknown map: %s" % name)
+
+
+def normalize(name: str):
+    return ' '.join(name.lower().replace('-', ' ').split())
+
+def edit_distance(a: str, b: str, limit: int = None):
+    """Levenshtein distance between two strings, counting swapped adjacent
+    characters as a single edit. Stops early once every path exceeds
+    `limit`, returning `limit + 1`."""
+    if abs(len(a) - len(b)) > (limit if limit is not None else len(a) + len(b)):
+        return limit + 1
+
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            row[j] = min(prev[j] + 1, row[j-1] + 1, prev[j-1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and ca == b[j-2] and a[i-2] == cb:
+                row[j] = min(row[j], prev2[j-2] + 1)
+        if limit is not None and min(row) > limit:
+            return limit + 1
+        prev2, prev = prev, row
+    return prev[-1]
+
+
+class MapIndex:
+    """Resolves user input to a map of the map pool.
+
+    Names and aliases are looked up directly. Failing that, input that is
+    the start of exactly one map's name or alias resolves to that map,
+    and otherwise the closest name within a small edit distance is used,
+    so that "foy nite" still resolves to "Foy Night".
+    """
+
+    def __init__(self, maps: List[str], aliases: Dict[str, List[str]] = None):
+        self.maps = list(maps)
+        self._names: Dict[str, int] = dict()
+        self._prefixes: Dict[str, set] = dict()
+        # Input that has been resolved before, with the resulting index and suggestions
+        self._resolved: Dict[str, tuple] = dict()
+
+        for i, name in enumerate(self.maps):
+            self._add(name, i)
+
+        lowered = {m.lower(): i for i, m in enumerate(self.maps)}
+        for name, map_aliases in (aliases or {}).items():
+            i = lowered.get(name.lower())
+            if i is None:
+                # Not part of the current map pool
+                continue
+            for alias in map_aliases:
+                self._add(alias, i)
+
+    def _add(self, name: str, i: int):
+        name = normalize(name)
+        if not name:
+            return
+        self._names.setdefault(name, i)
+        for length in range(1, len(name) + 1):
+            self._prefixes.setdefault(name[:length], set()).add(i)
+
+    def index(self, name: str):
+        """Get the index of a map by its exact name or alias, ignoring case."""
+        i = self._names.get(normalize(name))
+        if i is None:
+            raise UnknownMap(name, self.suggest(name))
+        return i
+
+    def resolve(self, name: str):
+        """Get the index of the map that best matches the given name."""
+        key = normalize(name)
+        res = self._resolved.get(key)
+        if res is None:
+            if len(self._resolved) >= RESOLVE_CACHE_SIZE:
+                self._resolved.clear()
+            i = self._resolve(key)
+            res = self._resolved[key] = (i, self.suggest(key) if i is None else None)
+
+        i, suggestions = res
+        if i is None:
+            raise UnknownMap(name, suggestions)
+        return i
+
+    def _resolve(self, key: str):
+        i = self._names.get(key)
+        if i is not None:
+            return i
+
+        matches = self._prefixes.get(key)
+        if matches and len(matches) == 1:
+            return next(iter(matches))
+
+        if not matches:
+            limit = max(1, len(key) // 2)
+            ranked = self._rank(key, limit)
+            if ranked:
+                best_distance = ranked[0][0]
+                best = {i for distance, i in ranked if distance == best_distance}
+                if len(best) == 1:
+                    return ranked[0][1]
+
+        return None
+
+    def _rank(self, key: str, limit: int = None):
+        """Get (distance, index) pairs for all maps, closest first. Every map
+        is only included once, by its closest name or alias."""
+        distances = dict()
+        for name, i in self._names.items():
+            distance = edit_distance(key, name, limit)
+            if limit is not None and distance > limit:
+                continue
+            if distance < distances.get(i, distance + 1):
+                distances[i] = distance
+        return sorted((distance, i) for i, distance in distances.items())
+
+    def suggest(self, name: str, amount: int = 3):
+        """Get the names of the maps that are most similar to the given name."""
+        key = normalize(name)
+        suggestions = [self.maps[i] for i in sorted(self._prefixes.get(key, ()))]
+        for _, i in self._rank(key):
+            if self.maps[i] not in suggestions:
+                suggestions.append(self.maps[i])
+        return suggestions[:amount]
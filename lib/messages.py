@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import discord
+
+# Number of message handles that are kept around, including those of
+# messages that are known to be deleted
+HANDLE_CACHE_SIZE = 1024
+
+# Handles of messages by (channel ID, message ID), least recently used
+# first. None means the message is known to no longer exist.
+MESSAGE_HANDLES: OrderedDict[Tuple[int, int], Optional[discord.PartialMessage]] = OrderedDict()
+
+
+def _store(key: Tuple[int, int], handle: Optional[discord.PartialMessage]):
+    MESSAGE_HANDLES[key] = handle
+    MESSAGE_HANDLES.move_to_end(key)
+    while len(MESSAGE_HANDLES) > HANDLE_CACHE_SIZE:
+        MESSAGE_HANDLES.popitem(last=False)
+
+def get_message(channel: discord.abc.Messageable, message_id: int) -> Optional[discord.PartialMessage]:
+    """Get a handle to edit or delete a message with, without fetching it
+    first. Returns None if the message is known to no longer exist."""
+    if not channel or not message_id:
+        return None
+    key = (channel.id, message_id)
+    if key in MESSAGE_HANDLES:
+        MESSAGE_HANDLES.move_to_end(key)
+        return MESSAGE_HANDLES[key]
+    handle = channel.get_partial_message(message_id)
+    _store(key, handle)
+    return handle
+
+def mark_missing(channel_id: int, message_id: int):
+    _store((channel_id, message_id), None)
+
+def is_missing(channel_id: int, message_id: int):
+    return MESSAGE_HANDLES.get((channel_id, message_id), False) is None
+
+
+async def edit_message(channel: discord.abc.Messageable, message_id: int, **payload):
+    """Edit a message. Returns False if it no longer exists."""
+    handle = get_message(channel, message_id)
+    if handle is None:
+        return False
+    try:
+        await handle.edit(**payload)
+    except discord.NotFound:
+        mark_missing(channel.id, message_id)
+        return False
+    return True
+
+async def delete_message(channel: discord.abc.Messageable, message_id: int):
+    """Delete a message, if it still exists."""
+    handle = get_message(channel, message_id)
+    if handle is None:
+        return False
+    try:
+        await handle.delete()
+    except discord.NotFound:
+        mark_missing(channel.id, message_id)
+        return False
+    mark_missing(channel.id, message_id)
+    return True
+
+async def edit_or_send(channel: discord.abc.Messageable, message_id: int, send: bool = True, **payload) -> Optional[discord.Message]:
+    """Edit a message, or send it anew if it no longer exists. Returns the
+    message that was sent, if any."""
+    if await edit_message(channel, message_id, **payload):
+        return None
+    if not send:
+        return None
+    if 'attachments' in payload:
+        payload['files'] = payload.pop('attachments')
+    message = await channel.send(**payload)
+    _store((channel.id, message.id), channel.get_partial_message(message.id))
+    return message
@@ -0,0 +1,252 @@
+"""Versioned schema of seasonal.db.
+
+Every migration brings the database one version further, and the version
+a database is at is stored in its user_version. Databases created before
+this existed are at version 0, but may already contain any of the tables
+and columns of the first few versions, so those migrations only create
+what is missing.
+
+To change the schema, append a migration to MIGRATIONS. Never edit one
+that was already released.
+"""
+
+from typing import Callable, List
+import re
+import sqlite3
+
+from lib.progress import ProgressLog
+
+
+def get_version(db: sqlite3.Connection):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def has_table(db: sqlite3.Connection, table: str):
+    return bool(db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone())
+
+def add_column(db: sqlite3.Connection, table: str, column: str, type_: str):
+    """Add a column to a table, unless it already has it."""
+    columns = [row[1] for row in db.execute(f'PRAGMA table_info("{table}")')]
+    if column not in columns:
+        db.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {type_}')
+
+
+def _initial_tables(db: sqlite3.Connection):
+    db.execute("""CREATE TABLE IF NOT EXISTS "channels" (
+        "creation_time"	TEXT,
+        "guild_id"	INTEGER,
+        "channel_id"	INTEGER,
+        "message_id"	INTEGER,
+        "title"	TEXT,
+        "desc"	TEXT,
+        "match_start"	TEXT,
+        "map"	TEXT,
+        "team1"	TEXT,
+        "team2"	TEXT,
+        "banner_url"	TEXT,
+        "has_vote"	INTEGER,
+        "has_predictions"	INTEGER,
+        "result"	TEXT,
+        "vote_result"	TEXT,
+        "vote_coinflip_option"	INTEGER,
+        "vote_coinflip"	INTEGER,
+        "vote_server_option"	INTEGER,
+        "vote_server"	TEXT,
+        "vote_first_ban"	INTEGER,
+        "vote_progress"	BLOB,
+        "predictions_team1"	TEXT,
+        "predictions_team2"	TEXT,
+        "predictions_team1_emoji"	TEXT,
+        "predictions_team2_emoji"	TEXT,
+        "stream_delay"	INTEGER,
+        PRIMARY KEY("channel_id")
+    )""")
+    db.execute('''CREATE TABLE IF NOT EXISTS "streams" (
+        "id"	INTEGER,
+        "channel_id"	INTEGER,
+        "lang"	TEXT,
+        "name"	TEXT,
+        "url"	TEXT,
+        PRIMARY KEY("id"),
+        FOREIGN KEY("channel_id") REFERENCES channels("channel_id")
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS "config" (
+        "guild_id"	INTEGER,
+        "mod_role"	INTEGER,
+        "admin_role"	INTEGER,
+        "overview_channel_id"	INTEGER,
+        "overview_message_id"	INTEGER,
+        PRIMARY KEY("guild_id")
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS "calendar" (
+        "channel_id"	INTEGER,
+        "message_id"	INTEGER,
+        "category_id"	INTEGER,
+        "guild_id"	INTEGER,
+        PRIMARY KEY("category_id", "message_id"),
+        FOREIGN KEY("guild_id") REFERENCES config("guild_id")
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS "polls" (
+        "guild_id"	INTEGER,
+        "channel_id"	INTEGER,
+        "message_id"	INTEGER,
+        "votes"	TEXT,
+        "question"	TEXT,
+        PRIMARY KEY("message_id")
+    )''')
+
+def _binary_vote_progress(db: sqlite3.Connection):
+    add_column(db, 'channels', 'vote_snapshot', 'TEXT')
+    # Convert vote progress still stored in the old text format
+    rows = db.execute("SELECT channel_id, vote_progress FROM channels WHERE typeof(vote_progress) = 'text'").fetchall()
+    db.executemany('UPDATE channels SET vote_progress = ? WHERE channel_id = ?',
+                   [(ProgressLog(vote_progress).to_bytes(), channel_id) for channel_id, vote_progress in rows])
+
+def _predictions_table(db: sqlite3.Connection):
+    add_column(db, 'channels', 'prediction_winner', 'INTEGER')
+    has_predictions_table = has_table(db, 'predictions')
+
+    # Which team every user predicts to win a match
+    db.execute('''CREATE TABLE IF NOT EXISTS "predictions" (
+        "channel_id"	INTEGER,
+        "user_id"	INTEGER,
+        "team"	INTEGER,
+        PRIMARY KEY("channel_id", "user_id")
+    )''')
+    # How many predictions of each user turned out right or wrong. Kept up to
+    # date as results are set, so the leaderboard is a single read.
+    db.execute('''CREATE TABLE IF NOT EXISTS "prediction_scores" (
+        "guild_id"	INTEGER,
+        "user_id"	INTEGER,
+        "won"	INTEGER,
+        "lost"	INTEGER,
+        PRIMARY KEY("guild_id", "user_id")
+    )''')
+    db.execute('CREATE INDEX IF NOT EXISTS "prediction_scores_rank" ON "prediction_scores" ("guild_id", "won" DESC, "lost", "user_id")')
+
+    if has_predictions_table:
+        return
+
+    # Move predictions out of the comma-separated columns they used to be stored in
+    for channel_id, t1_pred, t2_pred, result in db.execute('SELECT channel_id, predictions_team1, predictions_team2, result FROM channels').fetchall():
+        for team, preds in ((1, t1_pred), (2, t2_pred)):
+            db.executemany('INSERT OR REPLACE INTO predictions VALUES (?,?,?)',
+                           [(channel_id, int(user_id), team) for user_id in (preds or '').split(',') if user_id])
+
+        winner = None
+        match = re.match(r"(\d) *[-:] *(\d)", result or '')
+        if match:
+            t1_score, t2_score = [int(score) for score in match.groups()]
+            winner = 1 if t1_score > t2_score else 2
+        db.execute('UPDATE channels SET prediction_winner = ? WHERE channel_id = ?', (winner, channel_id))
+
+    db.execute('''INSERT INTO prediction_scores (guild_id, user_id, won, lost)
+        SELECT c.guild_id, p.user_id, SUM(p.team = c.prediction_winner), SUM(p.team != c.prediction_winner)
+        FROM predictions p JOIN channels c ON c.channel_id = p.channel_id
+        WHERE c.prediction_winner IS NOT NULL
+        GROUP BY c.guild_id, p.user_id''')
+
+def _lookup_indexes(db: sqlite3.Connection):
+    db.execute('CREATE INDEX IF NOT EXISTS "channels_guild_id" ON "channels" ("guild_id")')
+    db.execute('CREATE INDEX IF NOT EXISTS "streams_channel_id" ON "streams" ("channel_id", "id")')
+    db.execute('CREATE INDEX IF NOT EXISTS "calendar_guild_id" ON "calendar" ("guild_id")')
+    db.execute('CREATE INDEX IF NOT EXISTS "polls_guild_id" ON "polls" ("guild_id")')
+
+
+# Migration N brings the database from version N-1 to version N
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _initial_tables,
+    _binary_vote_progress,
+    _predictions_table,
+    _lookup_indexes,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+def migrate(db: sqlite3.Connection, target: int = LATEST_VERSION):
+    """Bring the database up to the given version. Every migration runs in
+    its own transaction, so a failing one leaves the database at the last
+    version that completed."""
+    version = get_version(db)
+    if version > LATEST_VERSION:
+        raise RuntimeError(f"Database is at version {version}, but this version of the bot only knows up to {LATEST_VERSION}")
+
+    while version < target:
+        migration = MIGRATIONS[version]
+        try:
+            db.execute('BEGIN')
+            migration(db)
+            db.execute(f'PRAGMA user_version = {version + 1}')
+            db.commit()
+        except:
+            db.rollback()
+            raise
+        version += 1
+        print(f"Migrated database to version {version} ({migration.__name__.strip('_')})")
+
+
+if __name__ == "__main__":
+    # Benchmark the hot lookups against several seasons of matches, with
+    # and without the indexes of the lookup_indexes migration
+    import os
+    import random
+    import tempfile
+    import time
+
+    GUILDS = 20
+    SEASONS = 4
+    MATCHES_PER_SEASON = 250
+    STREAMS_PER_MATCH = 2
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = sqlite3.connect(path)
+    migrate(db, target=LATEST_VERSION - 1)
+
+    random.seed(0)
+    channel_id = 0
+    channels, streams, calendars, polls = [], [], [], []
+    for guild_id in range(1, GUILDS + 1):
+        for season in range(SEASONS):
+            category_id = guild_id * 1000 + season
+            calendars.append((1, 1, category_id, guild_id))
+            for _ in range(MATCHES_PER_SEASON):
+                channel_id += 1
+                channels.append(('2024-01-01T00:00:00', guild_id, channel_id, 0, 'Match', '', None, None, '1', '2', None, 1, 1,
+                                 random.choice(['5 - 0', '0 - 5', None]), None, 0, None, 0, None, None,
+                                 ProgressLog('4200,1221').to_bytes(), '', '', '1️⃣', '2️⃣', 0, None, None))
+                for _ in range(STREAMS_PER_MATCH):
+                    streams.append((len(streams), channel_id, 'UK', 'Caster', 'https://twitch.tv/'))
+            polls.append((guild_id, 1, guild_id * 1000 + season, '1:,2:', 'Question?'))
+    db.executemany('INSERT INTO channels VALUES (%s)' % ','.join('?' * 28), channels)
+    db.executemany('INSERT INTO streams VALUES (?,?,?,?,?)', streams)
+    db.executemany('INSERT INTO calendar VALUES (?,?,?,?)', calendars)
+    db.executemany('INSERT INTO polls VALUES (?,?,?,?,?)', polls)
+    db.commit()
+
+    guild_channels = [row[0] for row in db.execute('SELECT channel_id FROM channels WHERE guild_id = 1')]
+    queries = [
+        ('channels by guild', 'SELECT * FROM channels WHERE guild_id = ?', lambda: (random.randint(1, GUILDS),)),
+        ('streams of a channel', 'SELECT * FROM streams WHERE channel_id = ? ORDER BY id', lambda: (random.randint(1, channel_id),)),
+        ('streams of a guild', 'SELECT * FROM streams WHERE channel_id IN (%s) ORDER BY id' % ','.join('?' * len(guild_channels)), lambda: guild_channels),
+        ('calendar by guild', 'SELECT channel_id, message_id, category_id FROM calendar WHERE guild_id = ?', lambda: (random.randint(1, GUILDS),)),
+        ('polls by guild', 'SELECT * FROM polls WHERE guild_id = ?', lambda: (random.randint(1, GUILDS),)),
+    ]
+
+    def bench():
+        results = dict()
+        for name, sql, params in queries:
+            plan = ' '.join(row[-1] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params()))
+            n = 200
+            start = time.perf_counter()
+            for _ in range(n):
+                db.execute(sql, params()).fetchall()
+            results[name] = ((time.perf_counter() - start) * 1e6 / n, plan)
+        return results
+
+    print(f"{len(channels)} matches, {len(streams)} streams in {GUILDS} guilds")
+    before = bench()
+    migrate(db)
+    after = bench()
+    for name in before:
+        print(f"{name: <22} {before[name][0]:9.1f} µs -> {after[name][0]:7.1f} µs   {after[name][1]}")
+
+    db.close()
+    os.remove(path)
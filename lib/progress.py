@@ -0,0 +1,164 @@
+from collections.abc import MutableSequence
+from typing import Iterator, Tuple, Union
+
+# Binary format of the vote progress. The first byte is the version,
+# followed by one record of two bytes per action:
+#   byte 1: 0AAATTFF - action, team and faction
+#   byte 2: map index (or the middleground vote)
+VERSION = 1
+HEADER_SIZE = 1
+RECORD_SIZE = 2
+
+Record = Tuple[int, int, int, int]
+
+
+def encode_record(action: int, team: int, faction: int, map_index: int):
+    if not (0 < action < 8 and 0 <= team < 4 and 0 <= faction < 4 and 0 <= map_index < 256):
+        raise ValueError("Can't encode action %s%s%s%s" % (action, team, faction, map_index))
+    return bytes(((action << 4) | (team << 2) | faction, map_index))
+
+def decode_record(data, offset: int = 0) -> Record:
+    head = data[offset]
+    return (head >> 4, (head >> 2) & 0b11, head & 0b11, data[offset + 1])
+
+def parse_code(code: str) -> Record:
+    """Parse an action from the old text format, like "1221"."""
+    return (int(code[0]), int(code[1]), int(code[2]), int(code[3:]))
+
+def format_code(record: Record):
+    action, team, faction, map_index = record
+    return f"{action}{team}{faction}{map_index}"
+
+
+class ProgressLog(MutableSequence):
+    """The actions taken during a map vote, stored in the binary format.
+
+    Behaves like the list of text codes ("4200", "1221", ...) it replaces,
+    but records are only decoded when they are accessed.
+    """
+
+    def __init__(self, data: Union[bytes, str, None] = None):
+        if not data:
+            self._data = bytearray((VERSION,))
+        elif isinstance(data, str):
+            # The old, comma-separated text format
+            self._data = bytearray((VERSION,))
+            for code in data.split(','):
+                if code:
+                    self._data += encode_record(*parse_code(code))
+        else:
+            data = bytearray(data)
+            if data[0] != VERSION:
+                raise ValueError("Unsupported vote progress version %s" % data[0])
+            if (len(data) - HEADER_SIZE) % RECORD_SIZE:
+                raise ValueError("Vote progress data is truncated")
+            self._data = data
+
+    def __len__(self):
+        return (len(self._data) - HEADER_SIZE) // RECORD_SIZE
+
+    def _offset(self, index: int):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("progress index out of range")
+        return HEADER_SIZE + index * RECORD_SIZE
+
+    def record(self, index: int) -> Record:
+        return decode_record(self._data, self._offset(index))
+
+    def records(self, start: int = 0, stop: int = None) -> Iterator[Record]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            yield decode_record(self._data, HEADER_SIZE + index * RECORD_SIZE)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [format_code(self.record(i)) for i in range(*index.indices(len(self)))]
+        return format_code(self.record(index))
+
+    def __setitem__(self, index, code: str):
+        if isinstance(index, slice):
+            raise TypeError("ProgressLog does not support slice assignment")
+        offset = self._offset(index)
+        self._data[offset:offset + RECORD_SIZE] = encode_record(*parse_code(code))
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("ProgressLog only supports deleting contiguous ranges")
+            if start < stop:
+                del self._data[HEADER_SIZE + start * RECORD_SIZE:HEADER_SIZE + stop * RECORD_SIZE]
+        else:
+            offset = self._offset(index)
+            del self._data[offset:offset + RECORD_SIZE]
+
+    def insert(self, index: int, code: str):
+        index = max(0, min(index if index >= 0 else index + len(self), len(self)))
+        offset = HEADER_SIZE + index * RECORD_SIZE
+        self._data[offset:offset] = encode_record(*parse_code(code))
+
+    def append_record(self, action: int, team: int, faction: int, map_index: int):
+        self._data += encode_record(action, team, faction, map_index)
+
+    def prefix(self, length: int):
+        """Get the binary data of the first `length` records, without the header."""
+        return bytes(self._data[HEADER_SIZE:HEADER_SIZE + length * RECORD_SIZE])
+
+    def to_bytes(self):
+        return bytes(self._data)
+
+    def to_text(self):
+        return ','.join(self)
+
+    def __eq__(self, other):
+        if isinstance(other, ProgressLog):
+            return self._data == other._data
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"ProgressLog({list(self)!r})"
+
+
+if __name__ == "__main__":
+    # Round-trip check against the semantics of the text format
+    import random
+    from lib.vote import Action, Team, Faction, MapState, MiddleGroundVote, MapVote, MAPS
+
+    for _ in range(2000):
+        codes = list()
+        for _ in range(random.randint(0, 60)):
+            action = random.choice(list(Action))
+            if action == Action.ChoseMiddleGround:
+                code = (action, random.choice(list(Team)), Faction.Unknown, random.choice(list(MiddleGroundVote)))
+            elif action in (Action.WonCoinflip, Action.HasFirstBan):
+                code = (action, random.choice(list(Team)), Faction.Unknown, 0)
+            else:
+                code = (action, random.choice(list(Team)), random.choice([Faction.Allies, Faction.Axis]), random.randrange(len(MAPS)))
+            codes.append(format_code(tuple(int(v) for v in code)))
+        text = ','.join(codes)
+
+        log = ProgressLog(text)
+        assert list(log) == codes
+        assert log.to_text() == text
+        assert ProgressLog(log.to_bytes()) == log
+        assert len(log.to_bytes()) == HEADER_SIZE + RECORD_SIZE * len(codes)
+
+        # Replay the text codes the way MapVote always has
+        ref = MapVote()
+        for code in codes:
+            raw = ref._translate_action(code)
+            if 0 < raw['action'] <= 3:
+                ref.maps[raw['team']][raw['faction']][raw['map']] = MapState(raw['action'])
+            elif raw['action'] == Action.ChoseMiddleGround:
+                ref.mg_vote[raw['team']] = MiddleGroundVote(raw['map_index'])
+        vote = MapVote(data=log.to_bytes())
+        assert str(ref) == str(vote) and ref.mg_vote == vote.mg_vote
+
+        cut = random.randint(0, len(codes))
+        del log[cut:]
+        assert list(log) == codes[:cut]
+
+    print("Round-trip OK")
@@ -0,0 +1,291 @@
+from PIL import Image, ImageDraw, ImageFont
+from io import BytesIO
+import threading
+
+from utils import get_config
+
+# Layout, mirroring lib/vote/table.css
+CELL_WIDTH = 180
+MAP_WIDTH = 274
+ROW_HEIGHT = 37
+HEADER_HEIGHT = 48
+BREAK_HEIGHT = 6
+BORDER = 1
+HEADER_BORDER = 3
+PALETTE_STEPS = 32
+
+COLOR_BORDER = (0, 0, 0)
+COLOR_TEXT = (0, 0, 0)
+COLOR_CELL = (245, 245, 245) # WhiteSmoke
+COLOR_INDEX = (255, 255, 255)
+COLOR_HEADER = (128, 128, 128) # gray
+STATE_COLORS = {
+    'Available': COLOR_CELL,
+    'Banned': (255, 52, 86),
+    'Denied': (255, 179, 87),
+    'FinalPick': (152, 251, 152), # PaleGreen
+}
+
+FONT_PATHS = ["verdana.ttf", "Verdana.ttf", "DejaVuSans.ttf"]
+BOLD_FONT_PATHS = ["verdanab.ttf", "Verdana Bold.ttf", "DejaVuSans-Bold.ttf"]
+
+def _load_font(paths, size):
+    font_path = get_config().get('render', 'FontPath', fallback='')
+    if font_path:
+        paths = [font_path] + paths
+    for path in paths:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+FONT_HEADER = _load_font(BOLD_FONT_PATHS, 35)
+FONT_MAP = _load_font(FONT_PATHS, 29)
+FONT_FACTION = _load_font(FONT_PATHS, 29)
+FONT_FACTION_BOLD = _load_font(BOLD_FONT_PATHS, 29)
+
+
+def _fit_text(draw: ImageDraw.ImageDraw, text: str, font, width: int):
+    """Cut off text that doesn't fit within the given width, like
+    the `prevent-overflow` class does."""
+    text = str(text)
+    while text and draw.textlength(text, font=font) > width:
+        text = text[:-1]
+    return text
+
+def _draw_cell(draw: ImageDraw.ImageDraw, box, text: str, font, fill, border=BORDER):
+    x0, y0, x1, y1 = box
+    draw.rectangle(box, fill=fill, outline=COLOR_BORDER, width=border)
+    text = _fit_text(draw, text, font, x1 - x0 - 2*border - 4)
+    draw.text(((x0 + x1) / 2, (y0 + y1) / 2), text, font=font, fill=COLOR_TEXT, anchor="mm")
+
+def get_table_size(maps_with_breaks):
+    num_maps = len([m for m in maps_with_breaks if m])
+    num_breaks = len(maps_with_breaks) - num_maps
+    width = CELL_WIDTH * 4 + MAP_WIDTH
+    height = HEADER_HEIGHT + num_maps * ROW_HEIGHT + num_breaks * BREAK_HEIGHT
+    return width, height
+
+def get_column_offsets():
+    x_map = CELL_WIDTH * 2
+    x_team2 = x_map + MAP_WIDTH
+    return [0, CELL_WIDTH, x_team2, x_team2 + CELL_WIDTH]
+
+
+class TableRenderer:
+    """Draws the ban table for one map pool.
+
+    Everything that doesn't change during a ban phase, being the map
+    names, break rows and the cells of every (state, faction) pair, is
+    rasterized once. A frame is then built by copying the empty table,
+    pasting the tiles of all cells that are no longer available and
+    drawing the team names. All images share a single palette, which
+    makes encoding the PNG cheap.
+    """
+
+    def __init__(self, maps_with_breaks):
+        self.maps_with_breaks = list(maps_with_breaks)
+        self.width, self.height = get_table_size(self.maps_with_breaks)
+        self.columns = get_column_offsets()
+
+        # Y coordinate of each map's row
+        self.rows = list()
+        y = HEADER_HEIGHT
+        for mapname in self.maps_with_breaks:
+            if not mapname:
+                y += BREAK_HEIGHT
+            else:
+                self.rows.append(y)
+                y += ROW_HEIGHT
+
+        self.palette = self._build_palette()
+        base = self._draw_base()
+        tiles = {
+            (state, c % 2): self._draw_cell_tile(state, c % 2)
+            for state in STATE_COLORS
+            for c in range(2)
+        }
+
+        self.base = self._quantize(base)
+        self.tiles = {key: self._quantize(tile) for key, tile in tiles.items()}
+        self._header_tiles = dict()
+
+    def _build_palette(self):
+        """Every pixel is either a fill color, the text color or an
+        anti-aliased blend of the two, so a ramp per fill color covers
+        everything that can be drawn."""
+        palette = list()
+        for fill in [COLOR_INDEX, COLOR_HEADER] + list(STATE_COLORS.values()):
+            for i in range(PALETTE_STEPS):
+                t = i / (PALETTE_STEPS - 1)
+                palette += [round(f * (1 - t) + c * t) for f, c in zip(fill, COLOR_TEXT)]
+        img = Image.new("P", (1, 1))
+        img.putpalette(palette)
+        return img
+
+    def _quantize(self, img: Image.Image):
+        return img.quantize(palette=self.palette, dither=Image.Dither.NONE)
+
+    def _draw_base(self):
+        img = Image.new("RGB", (self.width, self.height), COLOR_INDEX)
+        draw = ImageDraw.Draw(img)
+
+        x_map = CELL_WIDTH * 2
+        x_team2 = x_map + MAP_WIDTH
+        _draw_cell(draw, (x_map, 0, x_team2 - 1, HEADER_HEIGHT - 1), "Maps", FONT_HEADER, COLOR_INDEX)
+
+        mapnames = [m for m in self.maps_with_breaks if m]
+        available = [self._draw_cell_tile('Available', 0), self._draw_cell_tile('Available', 1)]
+        for mapname, y in zip(mapnames, self.rows):
+            draw.line((x_map, y, x_map, y + ROW_HEIGHT - 1), fill=COLOR_BORDER, width=BORDER)
+            draw.line((x_team2 - 1, y, x_team2 - 1, y + ROW_HEIGHT - 1), fill=COLOR_BORDER, width=BORDER)
+            text = _fit_text(draw, mapname, FONT_MAP, MAP_WIDTH - 26)
+            draw.text((x_map + MAP_WIDTH / 2, y + ROW_HEIGHT / 2), text, font=FONT_MAP, fill=COLOR_TEXT, anchor="mm")
+
+            for c, x in enumerate(self.columns):
+                img.paste(available[c % 2], (x, y))
+
+        return img
+
+    def _draw_cell_tile(self, state: str, faction: int):
+        img = Image.new("RGB", (CELL_WIDTH, ROW_HEIGHT), COLOR_INDEX)
+        draw = ImageDraw.Draw(img)
+        font = FONT_FACTION_BOLD if state == 'FinalPick' else FONT_FACTION
+        _draw_cell(draw, (0, 0, CELL_WIDTH - 1, ROW_HEIGHT - 1), ("Allies", "Axis")[faction], font, STATE_COLORS[state])
+        return img
+
+    def _draw_header_tile(self, name: str):
+        img = Image.new("RGB", (CELL_WIDTH * 2, HEADER_HEIGHT), COLOR_INDEX)
+        draw = ImageDraw.Draw(img)
+        _draw_cell(draw, (0, 0, CELL_WIDTH * 2 - 1, HEADER_HEIGHT - 1), name, FONT_HEADER, COLOR_HEADER, HEADER_BORDER)
+        return img
+
+    def get_header_tile(self, name: str):
+        tile = self._header_tiles.get(name)
+        if tile is None:
+            tile = self._quantize(self._draw_header_tile(name))
+            if len(self._header_tiles) >= 256:
+                self._header_tiles.clear()
+            self._header_tiles[name] = tile
+        return tile
+
+    def render(self, columns, team1_name: str, team2_name: str):
+        img = self.base.copy()
+
+        for c, column in enumerate(columns):
+            x = self.columns[c]
+            for y, state in zip(self.rows, column):
+                if state != 'Available':
+                    img.paste(self.tiles[(state, c % 2)], (x, y))
+
+        img.paste(self.get_header_tile(str(team1_name)), (0, 0))
+        img.paste(self.get_header_tile(str(team2_name)), (self.columns[2], 0))
+
+        output = BytesIO()
+        img.save(output, format="PNG", compress_level=1)
+        output.seek(0)
+        return output
+
+
+_RENDERERS = dict()
+_RENDERERS_LOCK = threading.Lock()
+def get_renderer(maps_with_breaks):
+    key = tuple(maps_with_breaks)
+    with _RENDERERS_LOCK:
+        renderer = _RENDERERS.get(key)
+        if renderer is None:
+            renderer = TableRenderer(key)
+            _RENDERERS[key] = renderer
+    return renderer
+
+def render_table(maps_with_breaks, columns, team1_name: str, team2_name: str):
+    """Draw the ban table into a PNG image.
+
+    `columns` is a list of four lists with the names of the `MapState`
+    of each map, in the order Team 1 Allies, Team 1 Axis, Team 2 Allies
+    and Team 2 Axis.
+    """
+    return get_renderer(maps_with_breaks).render(columns, team1_name, team2_name)
+
+def render_table_full(maps_with_breaks, columns, team1_name: str, team2_name: str):
+    """Draw the entire ban table from scratch, without any pre-rasterized
+    tiles. Only used for comparison."""
+    width, height = get_table_size(maps_with_breaks)
+    img = Image.new("RGB", (width, height), COLOR_INDEX)
+    draw = ImageDraw.Draw(img)
+
+    # Header
+    x_map = CELL_WIDTH * 2
+    x_team2 = x_map + MAP_WIDTH
+    _draw_cell(draw, (0, 0, x_map - 1, HEADER_HEIGHT - 1), team1_name, FONT_HEADER, COLOR_HEADER, HEADER_BORDER)
+    _draw_cell(draw, (x_map, 0, x_team2 - 1, HEADER_HEIGHT - 1), "Maps", FONT_HEADER, COLOR_INDEX)
+    _draw_cell(draw, (x_team2, 0, width - 1, HEADER_HEIGHT - 1), team2_name, FONT_HEADER, COLOR_HEADER, HEADER_BORDER)
+
+    # Rows
+    y = HEADER_HEIGHT
+    i = -1
+    for mapname in maps_with_breaks:
+        if not mapname:
+            y += BREAK_HEIGHT
+            continue
+        i += 1
+
+        x = 0
+        for c, column in enumerate(columns):
+            if c == 2:
+                draw.rectangle((x, y, x + MAP_WIDTH - 1, y + ROW_HEIGHT - 1), fill=COLOR_INDEX)
+                draw.line((x, y, x, y + ROW_HEIGHT - 1), fill=COLOR_BORDER, width=BORDER)
+                draw.line((x + MAP_WIDTH - 1, y, x + MAP_WIDTH - 1, y + ROW_HEIGHT - 1), fill=COLOR_BORDER, width=BORDER)
+                text = _fit_text(draw, mapname, FONT_MAP, MAP_WIDTH - 26)
+                draw.text((x + MAP_WIDTH / 2, y + ROW_HEIGHT / 2), text, font=FONT_MAP, fill=COLOR_TEXT, anchor="mm")
+                x += MAP_WIDTH
+
+            state = column[i]
+            faction = "Allies" if c % 2 == 0 else "Axis"
+            font = FONT_FACTION_BOLD if state == 'FinalPick' else FONT_FACTION
+            _draw_cell(draw, (x, y, x + CELL_WIDTH - 1, y + ROW_HEIGHT - 1), faction, font, STATE_COLORS[state])
+            x += CELL_WIDTH
+
+        y += ROW_HEIGHT
+
+    output = BytesIO()
+    img.save(output, format="PNG")
+    output.seek(0)
+    return output
+
+
+if __name__ == "__main__":
+    # Benchmark the tiled renderer against drawing the full table and, if installed, wkhtmltoimage
+    import time
+    from random import choice
+    from lib.vote import MapVote, MAPS, MAPS_WITH_BREAKS, Team, Faction
+
+    vote = MapVote(team1="Team One", team2="Team Two")
+    for _ in range(6):
+        team = choice([Team.One, Team.Two])
+        faction = choice([Faction.Allies, Faction.Axis])
+        mapname = choice([m for m in MAPS if vote.maps[team][faction][m] == 0])
+        vote.ban(team, faction, mapname)
+    columns = [[state.name for state in column.values()] for data in vote.maps.values() for column in data.values()]
+
+    def bench(name, func, n=50):
+        func()
+        start = time.perf_counter()
+        for _ in range(n):
+            func()
+        print(f"{name: <16} {(time.perf_counter() - start) * 1000 / n:.2f} ms/frame")
+
+    start = time.perf_counter()
+    get_renderer(MAPS_WITH_BREAKS)
+    print(f"{'tile setup': <16} {(time.perf_counter() - start) * 1000:.2f} ms (once per map pool)")
+    bench("tiled", lambda: render_table(MAPS_WITH_BREAKS, columns, "Team One", "Team Two"))
+    bench("full", lambda: render_table_full(MAPS_WITH_BREAKS, columns, "Team One", "Team Two"))
+    try:
+        import imgkit
+        from lib.vote import __location__ as vote_location
+        html = vote._to_html()
+        css = vote_location + '/vote/table.css'
+        bench("wkhtmltoimage", lambda: imgkit.from_string(html, False, css=css, options={'format': 'png', 'quiet': ''}), n=5)
+    except (ImportError, OSError) as e:
+        print(f"{'wkhtmltoimage': <16} skipped, {e}")
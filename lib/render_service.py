@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import time
+
+class RenderService:
+    """Runs renders on a bounded thread pool so they never block the
+    event loop.
+
+    Renders are queued per key (usually a channel ID). Only one render
+    per key runs at a time, and if more requests come in while one is
+    running, only the latest of them is rendered. Everyone who was
+    waiting on a dropped request receives that newer image instead.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._pending: Dict[int, Tuple[Callable, List[asyncio.Future]]] = dict()
+        self._running = set()
+
+        self.renders = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    async def render(self, key, func: Callable):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        if key in self._pending:
+            # A newer state replaces the one still waiting to be rendered
+            _, futs = self._pending[key]
+            self.dropped += 1
+        else:
+            futs = list()
+        futs.append(fut)
+        self._pending[key] = (func, futs)
+
+        if key not in self._running:
+            self._running.add(key)
+            loop.create_task(self._worker(key))
+
+        return await fut
+
+    async def _worker(self, key):
+        loop = asyncio.get_running_loop()
+        try:
+            while key in self._pending:
+                func, futs = self._pending.pop(key)
+                start = time.perf_counter()
+                try:
+                    res = await loop.run_in_executor(self.executor, func)
+                except Exception as e:
+                    for fut in futs:
+                        if not fut.done():
+                            fut.set_exception(e)
+                else:
+                    for fut in futs:
+                        if not fut.done():
+                            fut.set_result(res)
+                finally:
+                    self._record(time.perf_counter() - start)
+        finally:
+            self._running.discard(key)
+
+    def _record(self, latency: float):
+        self.renders += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        return dict(
+            queue_depth=self.queue_depth,
+            running=len(self._running),
+            renders=self.renders,
+            dropped=self.dropped,
+            avg_latency=(self.total_latency / self.renders) if self.renders else 0.0,
+            max_latency=self.max_latency,
+            last_latency=self.last_latency,
+        )
+
+    def shutdown(self):
+        """Stop rendering. Whoever still waits on a render that didn't start
+        yet is cancelled, rather than left waiting on a closed event loop."""
+        for _, futs in self._pending.values():
+            for fut in futs:
+                fut.cancel()
+        self._pending.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,17 +1,10 @@
-import sqlite3
-db = sqlite3.connect('seasonal.db')
+from typing import List
+
+from lib.db import db, database
 cur = db.cursor()
 
-cur.execute('''CREATE TABLE IF NOT EXISTS "streams" (
-	"id"	INTEGER,
-	"channel_id"	INTEGER,
-	"lang"	TEXT,
-	"name"	TEXT,
-	"url"	TEXT,
-	PRIMARY KEY("id"),
-	FOREIGN KEY("channel_id") REFERENCES channels("channel_id")
-)''')
-db.commit()
+# SQLite's default limit of parameters in a single query
+MAX_QUERY_PARAMS = 999
 
 FLAGS = dict(
     UK=("EN", "🇬🇧"),
@@ -26,46 +19,70 @@ FLAGS = dict(
     AU=("EN", "🇦🇺"),
 )
 
+# The streams of each channel that has been loaded, in order of ID
+STREAMS_BY_CHANNEL = dict()
+
 class Stream:
     def __init__(self, id_: int):
         cur.execute('SELECT * FROM streams WHERE id = ?', (id_,))
         res = cur.fetchone()
         if not res: raise ValueError("There is no stream with ID %s" % id_)
+        self._load(res)
 
-        (self.id, self.channel_id, self.lang, self.name, self.url) = res
+    def _load(self, row):
+        (self.id, self.channel_id, self.lang, self.name, self.url) = row
 
     @classmethod
-    def new(cls, channel_id: int, lang: str, name: str, url: str):
-        cur.execute('SELECT MAX(id) FROM streams')
-        (id_,) = cur.fetchone()
-        if id_ is None:
-            id_ = 0
-        else:
-            id_ += 1
+    def from_row(cls, row):
+        stream = cls.__new__(cls)
+        stream._load(row)
+        return stream
 
-        cur.execute(
-            "INSERT INTO streams VALUES (?,?,?,?,?)",
-            (id_, int(channel_id), str(lang).upper(), str(name), str(url))
+    @classmethod
+    async def new(cls, channel_id: int, lang: str, name: str, url: str):
+        # Pick the ID inside of the insert, so streams added at the same time can't get the same one
+        id_ = await database.execute(
+            "INSERT INTO streams VALUES ((SELECT IFNULL(MAX(id) + 1, 0) FROM streams),?,?,?,?)",
+            (int(channel_id), str(lang).upper(), str(name), str(url))
         )
-        db.commit()
+        STREAMS_BY_CHANNEL.pop(int(channel_id), None)
         return cls(id_)
 
-    def save(self):
-        cur.execute(
+    async def save(self):
+        await database.execute(
             'UPDATE streams SET channel_id = ?, lang = ?, name = ?, url = ? WHERE id = ?',
             (int(self.channel_id), str(self.lang).upper(), str(self.name), str(self.url), int(self.id))
         )
-        db.commit()
+        # The stream may have moved to another channel
+        STREAMS_BY_CHANNEL.clear()
 
-    def delete(self):
-        cur.execute('DELETE FROM streams WHERE id = ?', (self.id,))
-        db.commit()
+    async def delete(self):
+        await database.execute('DELETE FROM streams WHERE id = ?', (self.id,))
+        STREAMS_BY_CHANNEL.pop(int(self.channel_id), None)
         self = None
 
     @classmethod
     def in_channel(cls, channel_id: int):
-        cur.execute('SELECT id FROM streams WHERE channel_id = ? ORDER BY id', (int(channel_id),))
-        return [cls(i) for (i,) in cur.fetchall()]
+        channel_id = int(channel_id)
+        if channel_id not in STREAMS_BY_CHANNEL:
+            cur.execute('SELECT * FROM streams WHERE channel_id = ? ORDER BY id', (channel_id,))
+            STREAMS_BY_CHANNEL[channel_id] = [cls.from_row(row) for row in cur.fetchall()]
+        return list(STREAMS_BY_CHANNEL[channel_id])
+
+    @classmethod
+    async def in_channels(cls, channel_ids: List[int]):
+        """Load the streams of many channels in a single query. Returns a
+        dict of channel ID to a list of streams."""
+        channel_ids = [int(channel_id) for channel_id in channel_ids]
+        missing = [channel_id for channel_id in channel_ids if channel_id not in STREAMS_BY_CHANNEL]
+        for i in range(0, len(missing), MAX_QUERY_PARAMS):
+            chunk = missing[i:i + MAX_QUERY_PARAMS]
+            rows = await database.fetchall('SELECT * FROM streams WHERE channel_id IN (%s) ORDER BY id' % ','.join('?' * len(chunk)), chunk)
+            loaded = {channel_id: [] for channel_id in chunk}
+            for row in rows:
+                loaded[row[1]].append(cls.from_row(row))
+            STREAMS_BY_CHANNEL.update(loaded)
+        return {channel_id: list(STREAMS_BY_CHANNEL[channel_id]) for channel_id in channel_ids}
 
     @property
     def flag(self):
@@ -0,0 +1,126 @@
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+import asyncio
+import heapq
+import itertools
+
+# Longest time to sleep at once, in seconds, so that long waits are
+# checked against the wall clock every now and then
+MAX_SLEEP = 3600
+
+
+class TimerHeap:
+    """Calls a function for a key once a given moment has passed.
+
+    Every key has at most one timer. Setting it again moves the timer,
+    which leaves the old entry in the heap to be skipped once it comes up,
+    so changing a timer is as cheap as adding one. A single task sleeps
+    until the earliest timer is due.
+    """
+
+    def __init__(self, callback: Callable[[Hashable], Awaitable]):
+        self.callback = callback
+        self._heap: List[Tuple[datetime, int, Hashable]] = list()
+        self._due: Dict[Hashable, datetime] = dict()
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task = None
+
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._due)
+
+    def set(self, key: Hashable, when: datetime = None):
+        """Call back for the key at the given moment, replacing its current
+        timer. Moments that have already passed, or None, remove the timer."""
+        if when is None or when <= datetime.now(timezone.utc):
+            self.cancel(key)
+            return
+        if self._due.get(key) == when:
+            return
+        self._due[key] = when
+        heapq.heappush(self._heap, (when, next(self._counter), key))
+        if self._heap[0][2] == key:
+            # This is the new earliest timer
+            self._changed.set()
+
+    def cancel(self, key: Hashable):
+        self._due.pop(key, None)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def _pop_due(self, now: datetime):
+        keys = list()
+        while self._heap:
+            when, _, key = self._heap[0]
+            if self._due.get(key) != when:
+                # Moved or cancelled since
+                heapq.heappop(self._heap)
+            elif when <= now:
+                heapq.heappop(self._heap)
+                del self._due[key]
+                keys.append(key)
+            else:
+                break
+        return keys
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            for key in self._pop_due(datetime.now(timezone.utc)):
+                self.fired += 1
+                try:
+                    await self.callback(key)
+                except Exception as e:
+                    print('Timer of', key, 'failed:', e.__class__.__name__, e)
+
+            timeout = MAX_SLEEP
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+
+if __name__ == "__main__":
+    # Check that timers fire in order, once, and only at their latest time
+    from datetime import timedelta
+    import random
+    import time
+
+    async def main():
+        fired = list()
+        async def callback(key):
+            fired.append((key, datetime.now(timezone.utc)))
+        timers = TimerHeap(callback)
+        timers.start()
+
+        now = datetime.now(timezone.utc)
+        expected = dict()
+        for key in range(1000):
+            for _ in range(3):
+                expected[key] = now + timedelta(seconds=random.uniform(0.1, 1.0))
+                timers.set(key, expected[key])
+        for key in range(0, 1000, 10):
+            timers.cancel(key)
+            del expected[key]
+
+        start = time.perf_counter()
+        while len(timers):
+            await asyncio.sleep(0.05)
+        timers.stop()
+
+        assert sorted(key for key, _ in fired) == sorted(expected)
+        assert all(at >= expected[key] for key, at in fired)
+        lateness = max((at - expected[key]).total_seconds() for key, at in fired)
+        print(f"{len(fired)} timers fired in {time.perf_counter() - start:.2f}s, at most {lateness * 1000:.1f}ms late")
+
+    asyncio.run(main())
@@ -1,25 +1,54 @@
 from pathlib import Path
-import imgkit
 from io import BytesIO
 from enum import IntEnum
-
+from functools import partial
+from typing import Callable
+import hashlib
+import zlib
+
+from lib.cache import RenderCache
+from lib.maps import MapIndex
+from lib.progress import ProgressLog, parse_code
+from lib.render_service import RenderService
 from utils import get_config, unpack_cfg_list
 
 import os
 __location__ = os.path.realpath(
     os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
-app_path = get_config().get('wkhtmltoimage', 'AppPath')
-if app_path:
-    app_path = Path(app_path)
-    if not app_path.is_absolute():
-        app_path = Path(os.getcwd()) / app_path
-    config = imgkit.config(wkhtmltoimage=Path(__location__+'/vote/wkhtmltopdf/bin/wkhtmltoimage.exe'))
+RENDER_BACKEND = get_config().get('render', 'Backend', fallback='pillow').lower()
+if RENDER_BACKEND not in ('pillow', 'wkhtmltoimage'):
+    raise ValueError('Unknown render backend "%s", expected "pillow" or "wkhtmltoimage"' % RENDER_BACKEND)
+
+if RENDER_BACKEND == 'wkhtmltoimage':
+    import imgkit
+    app_path = get_config().get('wkhtmltoimage', 'AppPath')
+    if app_path:
+        app_path = Path(app_path)
+        if not app_path.is_absolute():
+            app_path = Path(os.getcwd()) / app_path
+        config = imgkit.config(wkhtmltoimage=Path(__location__+'/vote/wkhtmltopdf/bin/wkhtmltoimage.exe'))
+    else:
+        config = imgkit.config()
 else:
-    config = imgkit.config()
+    from lib.render import render_table
+
+RENDER_CACHE = RenderCache(
+    max_size=get_config().getint('render', 'CacheSize', fallback=64),
+    directory=get_config().get('render', 'CacheDirectory', fallback='') or None,
+    max_files=get_config().getint('render', 'CacheFiles', fallback=1000),
+)
+RENDER_SERVICE = RenderService(
+    max_workers=get_config().getint('render', 'Workers', fallback=2),
+)
 
 MAPS_WITH_BREAKS = unpack_cfg_list(get_config().get('behavior', 'MapPool'))
 MAPS = [m for m in MAPS_WITH_BREAKS if m]
+MAP_ALIASES = {
+    name: [alias.strip() for alias in unpack_cfg_list(aliases) if alias.strip()]
+    for name, aliases in get_config()['behavior.aliases'].items()
+} if get_config().has_section('behavior.aliases') else {}
+MAP_LOOKUP = MapIndex(MAPS, MAP_ALIASES)
 ACTIONS = ['available', 'chosen_by_you', 'chosen_by_opponent', 'final_pick']
 
 HTML_MAP_ROW = """
@@ -84,13 +113,87 @@ class MiddleGroundVote(IntEnum):
         else:
             return None
 
+# How often MapVote keeps a copy of its state, in actions
+SNAPSHOT_INTERVAL = 8
+
+MAP_INDEX = {m: i for i, m in enumerate(MAPS)}
+FULL_MASK = (1 << len(MAPS)) - 1
+
+class MapColumn:
+    """The state of every map for one team and faction. States are packed
+    two bits per map into a single int, and a second int keeps one bit per
+    map that is no longer available, so counting available maps is a
+    popcount.
+
+    Behaves like a dict of map names to their `MapState`.
+    """
+    __slots__ = ('bits', 'taken')
+
+    def __init__(self, bits: int = 0, taken: int = 0):
+        self.bits = bits
+        self.taken = taken
+
+    def copy(self):
+        return MapColumn(self.bits, self.taken)
+
+    def get_state(self, index: int):
+        return MapState((self.bits >> (index * 2)) & 0b11)
+
+    def set_state(self, index: int, state: MapState):
+        shift = index * 2
+        self.bits = (self.bits & ~(0b11 << shift)) | (int(state) << shift)
+        if state == MapState.Available:
+            self.taken &= ~(1 << index)
+        else:
+            self.taken |= 1 << index
+
+    def __getitem__(self, map: str):
+        return self.get_state(MAP_INDEX[map])
+    def __setitem__(self, map: str, state: MapState):
+        self.set_state(MAP_INDEX[map], MapState(state))
+    def __contains__(self, map: str):
+        return map in MAP_INDEX
+    def __iter__(self):
+        return iter(MAPS)
+    def __len__(self):
+        return len(MAPS)
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return list(MAPS)
+    def values(self):
+        return [self.get_state(i) for i in range(len(MAPS))]
+    def items(self):
+        return [(m, self.get_state(i)) for i, m in enumerate(MAPS)]
+
+    @property
+    def num_available(self):
+        return len(MAPS) - self.taken.bit_count()
+
+    def available(self):
+        """Get the indexes of all available maps"""
+        free = ~self.taken & FULL_MASK
+        indexes = list()
+        while free:
+            lowest = free & -free
+            indexes.append(lowest.bit_length() - 1)
+            free ^= lowest
+        return indexes
+
+    def to_str(self):
+        return ''.join(str((self.bits >> (i * 2)) & 0b11) for i in range(len(MAPS)))
+
+
 class MapVote:
 
-    def _translate_action(self, act: str):
-        action = Action(int(act[0]))
-        team = Team(int(act[1]))
-        faction = Faction(int(act[2]))
-        map_index = int(act[3:])
+    def _translate_action(self, act):
+        if isinstance(act, str):
+            act = parse_code(act)
+        action = Action(act[0])
+        team = Team(act[1])
+        faction = Faction(act[2])
+        map_index = act[3]
         
         map = MAPS[map_index]
         
@@ -105,18 +208,17 @@ class MapVote:
     def get_last_team(self):
         if not self.progress:
             return None
-        raw = self._translate_action(self.progress[-1])
-        return raw['team']
+        return Team(self.progress.record(-1)[1])
 
-    def __init__(self, data=None, team1="TEAM 1", team2="TEAM 2"):
+    def __init__(self, data=None, team1="TEAM 1", team2="TEAM 2", snapshot: str = None):
         self.maps = {
             Team.One: {
-                Faction.Allies: {k: MapState.Available for k in MAPS},
-                Faction.Axis: {k: MapState.Available for k in MAPS}
+                Faction.Allies: MapColumn(),
+                Faction.Axis: MapColumn()
             },
             Team.Two: {
-                Faction.Allies: {k: MapState.Available for k in MAPS},
-                Faction.Axis: {k: MapState.Available for k in MAPS}
+                Faction.Allies: MapColumn(),
+                Faction.Axis: MapColumn()
             }
         }
 
@@ -130,49 +232,112 @@ class MapVote:
             Team.Two: str(team2),
         }
 
-        if not data:
-            self.progress = list()
-        else:
-            self.progress = data.split(',')
-
-        for action in self.progress:
-            raw = self._translate_action(action)
-            team = raw['team']
-            faction = raw['faction']
-            action = raw['action']
-
-            if 0 < action <= 3:
-                self.maps[team][faction][raw['map']] = MapState(raw['action'])
-            elif action == Action.ChoseMiddleGround:
-                self.mg_vote[team] = MiddleGroundVote(raw['map_index'])
+        self.progress = ProgressLog(data)
+
+        # Copies of the derived state, keyed by the length of the progress at the time
+        self._snapshots = {0: self._get_state()}
+
+        start = 0
+        if snapshot:
+            start = self._load_snapshot(snapshot)
+
+        for i, record in enumerate(self.progress.records(start), start):
+            self._apply(record)
+            self._take_snapshot(i + 1)
+
+    def _apply(self, record):
+        action, team, faction, map_index = record
+        if 0 < action <= 3:
+            self.maps[team][faction].set_state(map_index, MapState(action))
+        elif action == Action.ChoseMiddleGround:
+            self.mg_vote[Team(team)] = MiddleGroundVote(map_index)
+
+    def _get_state(self):
+        columns = tuple((column.bits, column.taken) for team in self.maps.values() for column in team.values())
+        return (columns, self.mg_vote[Team.One], self.mg_vote[Team.Two])
+
+    def _set_state(self, state):
+        columns, mg1, mg2 = state
+        for column, (bits, taken) in zip([column for team in self.maps.values() for column in team.values()], columns):
+            column.bits = bits
+            column.taken = taken
+        self.mg_vote[Team.One] = mg1
+        self.mg_vote[Team.Two] = mg2
+
+    def _take_snapshot(self, length: int):
+        if length % SNAPSHOT_INTERVAL == 0:
+            self._snapshots[length] = self._get_state()
+
+    def _progress_checksum(self, length: int):
+        return zlib.crc32(self.progress.prefix(length))
+
+    def get_snapshot(self):
+        """Serialize the current state, so that a later `MapVote` can be
+        constructed without replaying the progress up to this point."""
+        columns, mg1, mg2 = self._get_state()
+        length = len(self.progress)
+        return ';'.join([
+            str(length),
+            '%x' % self._progress_checksum(length),
+            ','.join('%x.%x' % column for column in columns),
+            ','.join('-' if mg is None else str(mg.value) for mg in (mg1, mg2)),
+        ])
+
+    def _load_snapshot(self, snapshot: str):
+        """Restore the state from a snapshot. Returns the length of the
+        progress covered by it, or 0 if it doesn't match the progress."""
+        try:
+            length, checksum, columns, mg_votes = snapshot.split(';')
+            length = int(length)
+            if length > len(self.progress) or int(checksum, 16) != self._progress_checksum(length):
+                return 0
+            columns = tuple(tuple(int(v, 16) for v in column.split('.')) for column in columns.split(','))
+            mg1, mg2 = [None if mg == '-' else MiddleGroundVote(int(mg)) for mg in mg_votes.split(',')]
+            if len(columns) != 4:
+                return 0
+        except ValueError:
+            return 0
+
+        self._set_state((columns, mg1, mg2))
+        self._snapshots[length] = self._get_state()
+        return length
+
+    def undo(self, amount: int = 1):
+        """Remove the last actions from the progress and roll back the
+        state to the closest snapshot, replaying only what came after it."""
+        length = max(len(self.progress) - amount, 0)
+        del self.progress[length:]
+
+        for key in [key for key in self._snapshots if key > length]:
+            del self._snapshots[key]
+        start = max(self._snapshots)
+        self._set_state(self._snapshots[start])
+
+        for i, record in enumerate(self.progress.records(start, length), start):
+            self._apply(record)
+            self._take_snapshot(i + 1)
 
     def __str__(self):
-        columns = list()
-        for team in self.maps.values():
-            for row in team.values():
-                column = ['0'] * len(MAPS)
-                for i, value in enumerate(row.values()):
-                    column[i] = str(value.value)
-                column = ''.join(column)
-                columns.append(column)
-        return ','.join(columns)
+        return ','.join(column.to_str() for team in self.maps.values() for column in team.values())
 
+    def num_available(self):
+        """Get the amount of map/faction combinations still available
+        across all teams and factions"""
+        return sum(column.num_available for team in self.maps.values() for column in team.values())
 
-    def update(self, team: Team, faction: Faction, map: str, action: Action):
-        map_index = [m.lower() for m in MAPS].index(map.lower())
-        map = MAPS[map_index]
-
-        state = MapState(action)
 
+    def update(self, team: Team, faction: Faction, map: str, action: Action):
+        map_index = MAP_LOOKUP.index(map)
         self.add_progress(team=team, faction=faction, map_index=map_index, action=action)
-        self.maps[team][faction][map] = state
 
     def add_progress(self, team: Team, faction: Faction, map_index: int, action: Action):
         team = Team(team)
         faction = Faction(faction)
         action = Action(action)
-        code = str(action.value)+str(team.value)+str(faction.value)+str(map_index)
-        self.progress.append(code)
+        record = (action.value, team.value, faction.value, int(map_index))
+        self.progress.append_record(*record)
+        self._apply(record)
+        self._take_snapshot(len(self.progress))
 
     def ban(self, team: Team, faction: Faction, map: str):
         team = Team(team)
@@ -195,7 +360,39 @@ class MapVote:
         if vote == MiddleGroundVote.No and self.mg_vote[team.other()] is None:
             self.add_progress(team.other(), Faction.Unknown, map_index=MiddleGroundVote.Skipped.value, action=Action.ChoseMiddleGround)
 
+    def get_render_key(self):
+        key = '|'.join([RENDER_BACKEND, str(self), self.names[1], self.names[2], ','.join(MAPS_WITH_BREAKS)])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
     def render(self):
+        return self._get_renderer()()
+
+    async def render_async(self, channel_id: int = None):
+        """Render the table on the render worker pool. While a render for
+        the same channel is still running, only the latest state is kept."""
+        renderer = self._get_renderer()
+        if renderer.cached is not None:
+            return renderer()
+        # Every waiter gets its own buffer, as discord.File closes it after sending
+        img = await RENDER_SERVICE.render(channel_id or renderer.key, lambda: renderer().getvalue())
+        return BytesIO(img)
+
+    def _get_renderer(self):
+        """Snapshot the current state into a callable that renders it,
+        so that later changes to this vote don't affect the image."""
+        key = self.get_render_key()
+        if RENDER_BACKEND == 'wkhtmltoimage':
+            draw = partial(_render_wkhtmltoimage, self._to_html())
+        else:
+            columns = [
+                [state.name for state in column.values()]
+                for data in self.maps.values()
+                for column in data.values()
+            ]
+            draw = partial(render_table, MAPS_WITH_BREAKS, columns, self.names[1], self.names[2])
+        return _Renderer(key, draw)
+
+    def _to_html(self):
         states = dict()
 
         for team, data in self.maps.items():
@@ -207,13 +404,30 @@ class MapVote:
         states['team1_name'] = self.names[1]
         states['team2_name'] = self.names[2]
 
-        html = HTML_DOC.format(**states)
-        imgkit.from_string(html, 'output.png', config=config, css=Path(__location__+'/vote/table.css'), options={'format': 'png', 'quiet': ''})
-        with open('output.png', 'rb') as f:
-            img = BytesIO(f.read())
+        return HTML_DOC.format(**states)
+
+
+class _Renderer:
+    def __init__(self, key: str, draw: Callable[[], BytesIO]):
+        self.key = key
+        self.draw = draw
+        # Only what's in memory, as this runs on the event loop. The disk
+        # cache is checked on the render worker.
+        self.cached = RENDER_CACHE.peek(key)
 
+    def __call__(self):
+        cached = self.cached if self.cached is not None else RENDER_CACHE.get(self.key)
+        if cached is not None:
+            return BytesIO(cached)
+        img = self.draw()
+        RENDER_CACHE.put(self.key, img.getvalue())
         return img
 
+def _render_wkhtmltoimage(html: str):
+    # Passing False as output path makes wkhtmltoimage write the image to stdout,
+    # so nothing ever touches the disk
+    img = imgkit.from_string(html, False, config=config, css=Path(__location__+'/vote/table.css'), options={'format': 'png', 'quiet': ''})
+    return BytesIO(img)
 
 
 if __name__ == "__main__":